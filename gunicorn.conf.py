@@ -0,0 +1,22 @@
+"""
+Gunicorn config for schoolmemories, read from the working directory on start.
+
+The command line in schoolmemories.service sets the bind address and workers.
+"""
+
+
+def post_worker_init(worker):
+    """Build the filter bitmaps before the worker takes requests.
+
+    Otherwise the first index request each worker serves waits for them. If the
+    database is not ready yet, as before the first migrate, they are built on
+    first use instead.
+    """
+    from django.db import DatabaseError
+
+    from main import bitmaps
+
+    try:
+        bitmaps.memory_index.build()
+    except DatabaseError:
+        worker.log.exception("Could not build the filter bitmaps at startup")
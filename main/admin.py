@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from main import models
+from main import choices, models, search
 
 admin.site.site_header = "Admin Panel"
 
@@ -23,9 +23,17 @@ class PageAdmin(admin.ModelAdmin):
 
 @admin.register(models.Image)
 class ImageAdmin(admin.ModelAdmin):
-    list_display = ("name", "slug", "extension", "data_size", "uploaded_at")
+    list_display = (
+        "name",
+        "slug",
+        "extension",
+        "data_size",
+        "width",
+        "height",
+        "uploaded_at",
+    )
     search_fields = ("name", "slug")
-    readonly_fields = ("uploaded_at", "data_size")
+    readonly_fields = ("uploaded_at", "data_size", "width", "height", "sha256")
     list_filter = ("extension", "uploaded_at")
 
 
@@ -35,22 +43,13 @@ class MemoryAdmin(admin.ModelAdmin):
         "title",
         "code",
         "location",
-        "country",
-        "age",
-        "gender",
+        "country_display",
+        "age_display",
+        "gender_display",
         "school_grade",
-        "school_funding",
-    )
-    search_fields = (
-        "title",
-        "body",
-        "location",
-        "school_funding_other",
-        "educational_philosophy_other",
-        "religious_tradition_other",
-        "memory_themes",
-        "memory_themes_additional",
+        "school_funding_display",
     )
+    search_fields = tuple(search.FTS_COLUMNS)
     list_filter = ("country", "age", "gender", "school_funding", "school_grade")
     readonly_fields = (
         "id",
@@ -73,3 +72,27 @@ class MemoryAdmin(admin.ModelAdmin):
         "title",
         "body",
     )
+
+    # The admin turns a field's choices into a dict for every cell it shows,
+    # these read the labels from the registry instead
+    @admin.display(description="Country", ordering="country")
+    def country_display(self, obj):
+        return choices.label("country", obj.country)
+
+    @admin.display(description="Age", ordering="age")
+    def age_display(self, obj):
+        return choices.label("age", obj.age)
+
+    @admin.display(description="Gender", ordering="gender")
+    def gender_display(self, obj):
+        return choices.label("gender", obj.gender)
+
+    @admin.display(description="School funding", ordering="school_funding")
+    def school_funding_display(self, obj):
+        return choices.label("school_funding", obj.school_funding)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains over every search field
+        if not search_term:
+            return queryset, False
+        return search.filter_memories(queryset, search_term), False
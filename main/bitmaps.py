@@ -0,0 +1,361 @@
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from itertools import islice
+from operator import and_, or_
+from types import SimpleNamespace
+
+from django.utils import timezone
+
+from main import caching, facets, models
+
+# Filterable facets, named as in the index query string
+FACETS = (
+    "country",
+    "gender",
+    "heritage",
+    "school_grade",
+    "school_funding",
+    "memory_theme",
+)
+
+# Memory fields needed to work out which facet values a memory belongs to,
+# other than its themes, which are read from their link table
+FIELDS = (
+    "id",
+    "country",
+    "gender",
+    "heritage",
+    "heritage_key",
+    "school_grade",
+    "school_grade_key",
+    "school_funding",
+    "school_funding_other",
+    "school_funding_other_key",
+)
+
+# Type code of the sorted id arrays rare options are kept in, of 4 byte ids
+ID_ARRAY_TYPE = "I"
+
+# Bits extracted at a time when walking a bitmap for a page of ids
+WINDOW = 4096
+
+# Memories saved this long before the last sync are read again when catching
+# up, for saves whose updated_at was set just before the sync read the table
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def bitmap_from_ids(ids, max_id):
+    """Build a bitmap int with the bit of each id set, in time linear to max_id."""
+    data = bytearray(max_id // 8 + 1)
+    for memory_id in ids:
+        data[memory_id >> 3] |= 1 << (memory_id & 7)
+    return int.from_bytes(data, "little")
+
+
+def pack(ids, max_id):
+    """Store the ids of an option in whichever of a bitmap and a sorted id array is smaller.
+
+    A bitmap takes a bit for every id up to max_id, so an option that only
+    a few memories have is kept as an array of their ids instead.
+    """
+    ids = array(ID_ARRAY_TYPE, sorted(set(ids)))
+    if len(ids) * ids.itemsize * 8 < max_id:
+        return ids
+    return bitmap_from_ids(ids, max_id)
+
+
+def to_bitmap(entry, max_id):
+    """Get an option stored by pack as a bitmap."""
+    if isinstance(entry, int):
+        return entry
+    return bitmap_from_ids(entry, max_id)
+
+
+def membership(bitmap):
+    """Get a function that checks in constant time whether an id is in the bitmap."""
+    data = bitmap.to_bytes(bitmap.bit_length() // 8 + 1, "little")
+    size = len(data)
+    return lambda memory_id: (
+        memory_id >> 3 < size and data[memory_id >> 3] >> (memory_id & 7) & 1
+    )
+
+
+def iter_ids(bitmap, start, stop, reverse=False):
+    """Yield the ids set in the bitmap within [start, stop), in ascending or descending order."""
+    if reverse:
+        high = stop
+        while high > start:
+            low = max(start, high - WINDOW)
+            window = (bitmap >> low) & ((1 << (high - low)) - 1)
+            while window:
+                top = window.bit_length() - 1
+                yield low + top
+                window ^= 1 << top
+            high = low
+    else:
+        low = start
+        while low < stop:
+            high = min(stop, low + WINDOW)
+            window = (bitmap >> low) & ((1 << (high - low)) - 1)
+            while window:
+                lowest = window & -window
+                yield low + lowest.bit_length() - 1
+                window ^= lowest
+            low = high
+
+
+class MemoryBitmapIndex:
+    """Per-process bitmaps of memory ids for every filter option.
+
+    Bit n of a bitmap is set when the memory with id n has that option, so any
+    filter combination is answered with a few bitwise operations. Options few
+    memories have are kept as sorted id arrays instead, see pack, and turned
+    into bitmaps while answering a request. The bitmaps are built on first use
+    and then kept current by signals on Memory, while changes made by other
+    processes are caught up with in ensure_current.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bitmaps = None
+        self.all = 0
+        self.max_id = 0
+        # The "memories" generation and time of the last sync with the database
+        self.generation = None
+        self.synced_at = None
+
+    def build(self):
+        """Load the bitmaps for all memories from the database."""
+        (generation,) = caching.get_generations("memories")
+        synced_at = timezone.now()
+        ids_by_option, all_ids, max_id = self.load(
+            models.Memory.objects.all(), models.MemoryTheme.objects.all()
+        )
+        bitmaps = {option: pack(ids, max_id) for option, ids in ids_by_option.items()}
+        with self.lock:
+            self.bitmaps, self.all, self.max_id = bitmaps, all_ids, max_id
+            self.generation, self.synced_at = generation, synced_at
+
+    def load(self, queryset, theme_links):
+        """Read the options of the memories in queryset, and of the theme links given."""
+        ids_by_option = defaultdict(list)
+        all_ids = []
+        for row in queryset.values(*FIELDS).order_by().iterator(chunk_size=5000):
+            memory = SimpleNamespace(
+                memory_themes=None, memory_themes_additional=None, **row
+            )
+            all_ids.append(memory.id)
+            for facet, value, _ in facets.get_facet_values(memory):
+                ids_by_option[(facet, value)].append(memory.id)
+        # In (theme, memory) order, so each theme's memories come from its index
+        for name, memory_id in (
+            theme_links.values_list("theme__name", "memory_id")
+            .order_by("theme", "memory")
+            .iterator(chunk_size=5000)
+        ):
+            ids_by_option[("memory_theme", name)].append(memory_id)
+        max_id = max(all_ids, default=0)
+        return ids_by_option, bitmap_from_ids(all_ids, max_id), max_id
+
+    def ensure_current(self):
+        """Build the bitmaps if needed and catch up with changes made by other processes.
+
+        Any memory change moves the "memories" generation. When it has moved
+        since the last sync, memories saved since then are read again and
+        deleted ones dropped, so that this process never renders, and caches
+        for all the others, results it has not seen change.
+        """
+        if self.bitmaps is None:
+            self.build()
+            return
+        # Read before the queries, so that a change committed meanwhile moves
+        # the generation past this one and is caught up with next time
+        (generation,) = caching.get_generations("memories")
+        if generation == self.generation:
+            return
+        synced_at = timezone.now()
+        changed = models.Memory.objects.filter(
+            updated_at__gte=self.synced_at - SYNC_OVERLAP
+        )
+        ids_by_option, changed_ids, max_id = self.load(
+            changed, models.MemoryTheme.objects.filter(memory__in=changed)
+        )
+        with self.lock:
+            self.clear(changed_ids)
+            self.max_id = max(self.max_id, max_id)
+            for option, ids in ids_by_option.items():
+                entry = self.bitmaps.get(option)
+                if isinstance(entry, int):
+                    self.bitmaps[option] = entry | bitmap_from_ids(ids, self.max_id)
+                else:
+                    self.bitmaps[option] = pack([*(entry or ()), *ids], self.max_id)
+            self.all |= changed_ids
+
+        # Deletes leave nothing to read back, but show in the count
+        if models.Memory.objects.count() != self.all.bit_count():
+            existing = bitmap_from_ids(
+                models.Memory.objects.values_list("id", flat=True).iterator(),
+                self.max_id,
+            )
+            with self.lock:
+                deleted = self.all & ~existing
+                self.clear(deleted)
+                self.all &= ~deleted
+        self.generation, self.synced_at = generation, synced_at
+
+    def clear(self, ids):
+        """Clear the bits of the ids in every option bitmap; the caller holds the lock."""
+        mask = ~ids
+        is_cleared = membership(ids)
+        for option, entry in list(self.bitmaps.items()):
+            if isinstance(entry, int):
+                entry &= mask
+            else:
+                entry = array(
+                    ID_ARRAY_TYPE,
+                    (memory_id for memory_id in entry if not is_cleared(memory_id)),
+                )
+            if entry:
+                self.bitmaps[option] = entry
+            else:
+                del self.bitmaps[option]
+
+    def add(self, memory_id, options):
+        """Set the bit of a memory for each of its (facet, value, label) options."""
+        if self.bitmaps is None:
+            return
+        bit = 1 << memory_id
+        with self.lock:
+            self.max_id = max(self.max_id, memory_id)
+            for facet, value, _ in options:
+                entry = self.bitmaps.get((facet, value), array(ID_ARRAY_TYPE))
+                if isinstance(entry, int):
+                    entry |= bit
+                else:
+                    position = bisect_left(entry, memory_id)
+                    if position == len(entry) or entry[position] != memory_id:
+                        entry.insert(position, memory_id)
+                    if len(entry) * entry.itemsize * 8 >= self.max_id:
+                        # Grown past the size of its bitmap
+                        entry = bitmap_from_ids(entry, self.max_id)
+                self.bitmaps[(facet, value)] = entry
+            self.all |= bit
+
+    def remove(self, memory_id, options, keep=True):
+        """Clear the bit of a memory for each of the given options.
+
+        With keep=False the memory is also dropped from the set of all memories.
+        """
+        if self.bitmaps is None:
+            return
+        mask = ~(1 << memory_id)
+        with self.lock:
+            for facet, value, _ in options:
+                entry = self.bitmaps.get((facet, value))
+                if entry is None:
+                    continue
+                if isinstance(entry, int):
+                    entry &= mask
+                else:
+                    position = bisect_left(entry, memory_id)
+                    if position < len(entry) and entry[position] == memory_id:
+                        del entry[position]
+                if entry:
+                    self.bitmaps[(facet, value)] = entry
+                else:
+                    del self.bitmaps[(facet, value)]
+            if not keep:
+                self.all &= mask
+
+    def facet_bitmaps(self, filters):
+        """Get the combined bitmap of each facet that has filter values.
+
+        Values of the same facet are ORed, or ANDed when filters["match"] is "all".
+        """
+        combine = and_ if filters.get("match") == "all" else or_
+        return {
+            facet: reduce(
+                combine,
+                (
+                    to_bitmap(self.bitmaps.get((facet, value), 0), self.max_id)
+                    for value in filters[facet]
+                ),
+            )
+            for facet in FACETS
+            if filters.get(facet)
+        }
+
+    def match(self, filters, within=None):
+        """Get the bitmap of memories matching all filters, and the `within` bitmap if given."""
+        result = self.all if within is None else self.all & within
+        for bitmap in self.facet_bitmaps(filters).values():
+            result &= bitmap
+        return result
+
+    def facet_counts(self, filters, within=None):
+        """Count the memories each filter option would match, given the other active filters.
+
+        With match=all the option's own facet filters apply too, since picking
+        another value of the facet narrows the results further.
+        """
+        active = self.facet_bitmaps(filters)
+        base = self.all if within is None else self.all & within
+        options_by_facet = defaultdict(list)
+        for (facet, value), entry in self.bitmaps.items():
+            options_by_facet[facet].append((value, entry))
+
+        counts = {}
+        for facet in FACETS:
+            facet_base = base
+            for other, bitmap in active.items():
+                if other != facet or filters.get("match") == "all":
+                    facet_base &= bitmap
+            # Id arrays are counted by looking each id up
+            is_member = None
+            for value, entry in options_by_facet[facet]:
+                if isinstance(entry, int):
+                    count = (facet_base & entry).bit_count()
+                else:
+                    is_member = is_member or membership(facet_base)
+                    count = sum(map(is_member, entry))
+                counts[(facet, value)] = count
+        return counts
+
+    def paginate(self, bitmap, size, after=None, before=None):
+        """Get one page of ids from the bitmap in id order, with neighbouring page cursors."""
+        if before:
+            # No id lies beyond the highest bit, however large the cursor
+            before = min(before, bitmap.bit_length())
+            ids = list(islice(iter_ids(bitmap, 0, before, reverse=True), size + 1))
+            has_prev = len(ids) > size
+            # Only ids from the cursor on make a next page, and ids below the
+            # start a previous one
+            has_next = bool(bitmap >> before)
+            ids = ids[:size][::-1]
+        else:
+            start = min(after + 1 if after else 0, bitmap.bit_length())
+            ids = list(islice(iter_ids(bitmap, start, bitmap.bit_length()), size + 1))
+            has_prev = bool(bitmap & ((1 << start) - 1))
+            has_next = len(ids) > size
+            ids = ids[:size]
+        return {
+            "ids": ids,
+            "prev_cursor": ids[0] if ids and has_prev else None,
+            "next_cursor": ids[-1] if ids and has_next else None,
+        }
+
+    def footprint(self):
+        """Get the memory used by the bitmaps and id arrays in bytes."""
+        if self.bitmaps is None:
+            return 0
+        return sys.getsizeof(self.all) + sum(
+            sys.getsizeof(entry) for entry in self.bitmaps.values()
+        )
+
+
+memory_index = MemoryBitmapIndex()
@@ -0,0 +1,151 @@
+import contextlib
+import contextvars
+import fcntl
+import hashlib
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Counted for each key prefix passed to get_or_compute
+METRICS = ("hits", "misses", "stale", "coalesced")
+
+# How long a request waits for another worker's computation before doing its own
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.02
+# Keys are hashed onto this many lock files, so that their number stays fixed
+LOCK_STRIPES = 64
+
+# Set once get_or_compute returns a value older than the current generations,
+# so that responses built from it do not claim to be current
+served_stale = contextvars.ContextVar("served_stale", default=False)
+
+# Stripes held by the current thread, which nested computations may share
+held_stripes = threading.local()
+
+
+def generation_key(namespace):
+    return f"generation:{namespace}"
+
+
+def get_generations(*namespaces):
+    """Get the current generation of each namespace, in one cache read when all exist.
+
+    Generations are timestamps rather than counters, so a generation lost to
+    eviction is replaced by a new one and never goes back to an earlier value.
+    """
+    keys = [generation_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(namespace):
+    """Start a new generation, making values cached under the namespace stale in all workers."""
+    cache.set(generation_key(namespace), time.time_ns(), timeout=None)
+
+
+def make_key(namespaces, *parts):
+    """Build a cache key that changes whenever any of the namespaces is bumped."""
+    generations = "-".join(str(value) for value in get_generations(*namespaces))
+    return ":".join([*parts, generations])
+
+
+def count(prefix, metric):
+    key = f"metrics:{prefix}:{metric}"
+    cache.add(key, 0, timeout=None)
+    # The key may be evicted between add and incr, losing one count is fine
+    with contextlib.suppress(ValueError):
+        cache.incr(key)
+
+
+def stats(prefix):
+    """Get the metrics counted for a key prefix since they were last reset."""
+    found = cache.get_many([f"metrics:{prefix}:{metric}" for metric in METRICS])
+    return {metric: found.get(f"metrics:{prefix}:{metric}", 0) for metric in METRICS}
+
+
+def reset_stats(prefix):
+    cache.delete_many([f"metrics:{prefix}:{metric}" for metric in METRICS])
+
+
+@contextlib.contextmanager
+def lock(key, blocking=True):
+    """Hold an exclusive lock on a key, shared by all workers on this machine.
+
+    Yields whether the lock was acquired: without blocking this is False when
+    another worker holds it, and with blocking only after LOCK_TIMEOUT. Keys
+    hashed onto the same stripe wait for each other, except within one thread.
+    """
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    stripe = int.from_bytes(digest[:8], "big") % LOCK_STRIPES
+    if not hasattr(held_stripes, "stripes"):
+        held_stripes.stripes = set()
+    held = held_stripes.stripes
+    if stripe in held:
+        yield True
+        return
+
+    directory = Path(settings.CACHES["default"]["LOCATION"]) / "locks"
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / f"{stripe}.lock", "a") as f:
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+                break
+            except BlockingIOError:
+                if not blocking or time.monotonic() > deadline:
+                    acquired = False
+                    break
+                time.sleep(LOCK_POLL_INTERVAL)
+        if acquired:
+            held.add(stripe)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                held.discard(stripe)
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_or_compute(parts, compute, namespaces, timeout=None):
+    """Get a cached value, computing it at most once at a time across all workers.
+
+    The value is stored with the generations of the namespaces it depends on.
+    Once one of them is bumped, the stale value keeps being served while a
+    single worker recomputes it. When there is no value at all, concurrent
+    requests wait for the one computing it instead of all computing.
+
+    Values computed within the computation of another never wait: the worker
+    holding their stripe may itself be waiting for this one's, so they are
+    computed without the lock instead.
+    """
+    key = ":".join(parts)
+    generations = get_generations(*namespaces)
+    entry = cache.get(key)
+    if entry is not None and entry[0] == generations:
+        count(parts[0], "hits")
+        return entry[1]
+
+    nested = bool(getattr(held_stripes, "stripes", None))
+    with lock(key, blocking=entry is None and not nested) as acquired:
+        if entry is not None and not acquired:
+            count(parts[0], "stale")
+            served_stale.set(True)
+            return entry[1]
+        # Another worker may have computed it while this one waited
+        latest = cache.get(key)
+        if latest is not None and latest[0] == generations:
+            count(parts[0], "coalesced")
+            return latest[1]
+        count(parts[0], "misses")
+        value = compute()
+        cache.set(key, (generations, value), timeout)
+        return value
@@ -0,0 +1,72 @@
+from types import MappingProxyType
+
+from main import country
+
+COUNTRY_CHOICES = list(country.COUNTRIES.items())
+
+AGE_CHOICES = [(i, str(i)) for i in range(1, 19)]
+
+GENDER_CHOICES = [
+    ("BOY", "Boy"),
+    ("GIRL", "Girl"),
+    ("OTHER", "Other"),
+    ("PREFER_NOT_TO_SAY", "Prefer not to say"),
+]
+
+SCHOOL_FUNDING_CHOICES = [
+    ("GOVERNMENT_STATE", "Government/State"),
+    ("FAMILY", "Family"),
+    ("SCHOLARSHIP_DONATIONS", "Scholarship/Donations"),
+    ("OTHER", "Other"),
+]
+
+EDUCATIONAL_PHILOSOPHY_CHOICES = [
+    ("MONTESSORI", "Montessori"),
+    ("WALDORF", "Waldorf"),
+    ("REGGIO_EMILIA", "Reggio Emilia"),
+    ("PROGRESSIVE", "Progressive"),
+    ("INTERNATIONAL_BACCALAUREATE", "International Baccalaureate"),
+    ("FOREST_SCHOOL", "Forest School"),
+    ("HOMESCHOOLING", "Homeschooling"),
+    ("DOES_NOT_APPLY", "Does not apply"),
+    ("OTHER", "Other"),
+]
+
+RELIGIOUS_TRADITION_CHOICES = [
+    ("QUAKER", "Quaker"),
+    ("CATHOLIC", "Catholic"),
+    ("PROTESTANT_CHRISTIAN", "Protestant/Christian"),
+    ("JEWISH", "Jewish"),
+    ("MUSLIM", "Muslim"),
+    ("HINDU", "Hindu"),
+    ("BUDDHIST", "Buddhist"),
+    ("GREEK_ORTHODOX", "Greek Orthodox"),
+    ("DOES_NOT_APPLY", "Does not apply"),
+    ("OTHER", "Other"),
+]
+
+# Built once and read-only, so that display helpers, template filters and the
+# admin look labels up instead of turning the choices into a dict on every call
+COUNTRY_LABELS = MappingProxyType(dict(COUNTRY_CHOICES))
+AGE_LABELS = MappingProxyType(dict(AGE_CHOICES))
+GENDER_LABELS = MappingProxyType(dict(GENDER_CHOICES))
+SCHOOL_FUNDING_LABELS = MappingProxyType(dict(SCHOOL_FUNDING_CHOICES))
+EDUCATIONAL_PHILOSOPHY_LABELS = MappingProxyType(dict(EDUCATIONAL_PHILOSOPHY_CHOICES))
+RELIGIOUS_TRADITION_LABELS = MappingProxyType(dict(RELIGIOUS_TRADITION_CHOICES))
+
+# Label maps by Memory field name
+LABELS = MappingProxyType(
+    {
+        "country": COUNTRY_LABELS,
+        "age": AGE_LABELS,
+        "gender": GENDER_LABELS,
+        "school_funding": SCHOOL_FUNDING_LABELS,
+        "educational_philosophy": EDUCATIONAL_PHILOSOPHY_LABELS,
+        "religious_tradition": RELIGIOUS_TRADITION_LABELS,
+    }
+)
+
+
+def label(field, code):
+    """Get the label of a choice of a Memory field, or the code itself if unknown."""
+    return LABELS[field].get(code, code)
@@ -0,0 +1,81 @@
+import datetime
+import functools
+import hashlib
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from main import caching, pagecache
+
+
+def versioned(get_version):
+    """Decorate a view with ETag and Last-Modified headers from a content version.
+
+    get_version is called with the view's arguments and returns a (tag, changed_at)
+    pair, or None to skip conditional handling. Repeat visits then get a 304
+    before the view runs. Only requests that get the shared anonymous page are
+    handled, since logged in users and flash messages change what is rendered.
+    Pages built from stale cached values are sent without validators, and the
+    others with no-cache, so that browsers revalidate them on every visit.
+    """
+
+    def version(request, *args, **kwargs):
+        if not hasattr(request, "_content_version"):
+            request._content_version = (
+                get_version(request, *args, **kwargs)
+                if pagecache.is_cacheable(request)
+                else None
+            )
+        return request._content_version
+
+    def etag(request, *args, **kwargs):
+        current = version(request, *args, **kwargs)
+        if current is None:
+            return None
+        digest = hashlib.sha256(current[0].encode("utf-8")).hexdigest()[:32]
+        return f'"{digest}"'
+
+    def last_modified(request, *args, **kwargs):
+        current = version(request, *args, **kwargs)
+        return current[1] if current else None
+
+    conditional = condition(etag_func=etag, last_modified_func=last_modified)
+
+    def decorator(view):
+        conditional_view = conditional(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = caching.served_stale.set(False)
+            try:
+                response = conditional_view(request, *args, **kwargs)
+                # Without it browsers would reuse pages with a Last-Modified
+                # for a while without asking, and show them after an edit
+                has_version = getattr(request, "_content_version", None) is not None
+                if has_version and response.status_code in (200, 304):
+                    patch_cache_control(response, no_cache=True)
+                # The validators name the current version, which a page built
+                # from stale cached values is older than
+                if caching.served_stale.get():
+                    response.headers.pop("ETag", None)
+                    response.headers.pop("Last-Modified", None)
+            finally:
+                caching.served_stale.reset(token)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def generations_version(*namespaces, extra=""):
+    """Get a content version from the generations of namespaces, without a query.
+
+    Generations are nanosecond timestamps of the last change, so the newest one
+    is also when the content last changed.
+    """
+    generations = caching.get_generations(*namespaces)
+    changed_at = datetime.datetime.fromtimestamp(
+        max(generations) / 1e9, tz=datetime.UTC
+    )
+    return f"{extra}:{'-'.join(str(value) for value in generations)}", changed_at
@@ -0,0 +1,15 @@
+from main import caching, models
+
+
+def get_page_list():
+    """Get the slug and title of the pages linked from the navigation."""
+    return caching.get_or_compute(
+        ("page_list",),
+        lambda: list(models.Page.objects.values("slug", "title")),
+        ("pages",),
+    )
+
+
+def page_list(request):
+    # Passed uncalled, so templates without the navigation never read the cache
+    return {"page_list": get_page_list}
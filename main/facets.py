@@ -0,0 +1,122 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from main import caching, choices, models
+
+# Facets of free text, filtered by grouping key and labelled as typed
+FREE_TEXT_FACETS = ("heritage", "school_grade")
+
+# Facets offering predefined choices and an "other" free text, with the labels
+# of their choices. Free text options are the grouping key behind CUSTOM_PREFIX,
+# so they can never be mistaken for a choice
+MIXED_FACETS = {"school_funding": choices.SCHOOL_FUNDING_LABELS}
+CUSTOM_PREFIX = "custom:"
+
+
+def get_facet_values(memory):
+    """Get the set of (facet, value, label) filter options a memory belongs to.
+
+    Free text is grouped by its key, so spellings differing only in case or
+    spacing are one option.
+    """
+    values = {
+        ("country", memory.country, choices.COUNTRY_LABELS.get(memory.country)),
+        ("gender", memory.gender, choices.label("gender", memory.gender)),
+    }
+    if memory.heritage_key:
+        values.add(("heritage", memory.heritage_key, memory.heritage))
+    if memory.school_grade_key:
+        values.add(("school_grade", memory.school_grade_key, memory.school_grade))
+    if memory.school_funding != "OTHER":
+        label = choices.label("school_funding", memory.school_funding)
+        values.add(("school_funding", memory.school_funding, label))
+    elif memory.school_funding_other_key:
+        values.add(
+            (
+                "school_funding",
+                CUSTOM_PREFIX + memory.school_funding_other_key,
+                memory.school_funding_other,
+            )
+        )
+    themes = models.split_comma_separated(memory.memory_themes)
+    themes += models.split_comma_separated(memory.memory_themes_additional)
+    for theme in themes:
+        values.add(("memory_theme", theme, theme))
+    return values
+
+
+def filter_value(facet, value):
+    """Get the value of the filter option a value given in the query string selects.
+
+    Telling a choice from free text takes no query: free text carries
+    CUSTOM_PREFIX, and older links without it are told apart by not being a
+    choice.
+    """
+    if facet in FREE_TEXT_FACETS:
+        return models.grouping_key(value)
+    if facet in MIXED_FACETS:
+        if value.startswith(CUSTOM_PREFIX):
+            value = value.removeprefix(CUSTOM_PREFIX)
+        elif value in MIXED_FACETS[facet]:
+            return value
+        key = models.grouping_key(value)
+        return CUSTOM_PREFIX + key if key else ""
+    return value
+
+
+def adjust_counts(values, delta):
+    """Add delta to the count of each (facet, value, label), dropping empty facets.
+
+    Takes the same few queries however many values there are: missing options
+    are inserted in one statement and all counts updated in another.
+    """
+    if not values:
+        return
+    options = reduce(or_, (Q(facet=facet, value=value) for facet, value, _ in values))
+    with transaction.atomic():
+        if delta > 0:
+            models.Facet.objects.bulk_create(
+                [
+                    models.Facet(facet=facet, value=value, label=label)
+                    for facet, value, label in values
+                ],
+                ignore_conflicts=True,
+            )
+        models.Facet.objects.filter(options).update(count=F("count") + delta)
+        if delta < 0:
+            models.Facet.objects.filter(options, count__lte=0).delete()
+
+
+def rebuild(memory_model=models.Memory, facet_model=models.Facet):
+    """Recount all facets from scratch."""
+    counts = Counter()
+    for memory in memory_model.objects.only(
+        "country",
+        "gender",
+        "heritage",
+        "heritage_key",
+        "school_grade",
+        "school_grade_key",
+        "school_funding",
+        "school_funding_other",
+        "school_funding_other_key",
+        "memory_themes",
+        "memory_themes_additional",
+    ).iterator():
+        counts.update(get_facet_values(memory))
+    # Spellings grouped under one value are labelled with the most common one
+    options = {}
+    for (facet, value, label), count in counts.most_common():
+        options.setdefault((facet, value), [label, 0])[1] += count
+    with transaction.atomic():
+        facet_model.objects.all().delete()
+        facet_model.objects.bulk_create(
+            facet_model(facet=facet, value=value, label=label, count=count)
+            for (facet, value), (label, count) in options.items()
+        )
+        # Cached filter options and index pages are built from the facets
+        transaction.on_commit(lambda: caching.bump("memories"))
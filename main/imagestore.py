@@ -0,0 +1,231 @@
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from main import caching
+
+# Longest side of the optimized WebP rendition stored next to each upload
+MAX_DIMENSION = 2000
+WEBP_QUALITY = 80
+
+# Image info kept when re-encoding, all else (EXIF, XMP, comments, text) is dropped
+KEPT_INFO = ("icc_profile", "transparency", "background")
+
+# Widths that resized variants can be requested at, with ?w=
+VARIANT_WIDTHS = (300, 600, 1200)
+VARIANT_QUALITY = 80
+
+
+def path(sha256):
+    """Get where the file with the given SHA-256 hex digest is stored."""
+    return Path(settings.IMAGE_STORE_ROOT) / sha256[:2] / sha256
+
+
+def save(data):
+    """Store file contents under their SHA-256 digest and return the digest.
+
+    Identical files are stored once. Files are written to a temporary name
+    and renamed into place, so a partially written file is never served.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    destination = path(sha256)
+    if not destination.exists():
+        write(destination, data)
+    return sha256
+
+
+def save_chunks(chunks, limit):
+    """Stream file chunks into the store, hashing them on the way.
+
+    Returns (sha256, size), or None as soon as the file grows past limit bytes,
+    so an oversized upload is never read in full or kept.
+    """
+    root = Path(settings.IMAGE_STORE_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=root, delete=False) as f:
+        for chunk in chunks:
+            size += len(chunk)
+            if size > limit:
+                break
+            hasher.update(chunk)
+            f.write(chunk)
+    if size > limit:
+        os.unlink(f.name)
+        return None
+
+    sha256 = hasher.hexdigest()
+    destination = path(sha256)
+    if destination.exists():
+        os.unlink(f.name)
+    else:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, destination)
+    return sha256, size
+
+
+def write(destination, data):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=destination.parent, delete=False) as f:
+        f.write(data)
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, destination)
+
+
+def get_dimensions(file):
+    """Get the (width, height) of an image file or path, or (None, None) if unknown.
+
+    Only the image header is read, not the pixel data.
+    """
+    try:
+        with Image.open(file) as image:
+            return image.size
+    except (UnidentifiedImageError, OSError):
+        return None, None
+
+
+def make_webp(file):
+    """Encode an optimized WebP rendition of an image, or None if it cannot be decoded.
+
+    The rendition is rotated as the EXIF orientation says, capped at
+    MAX_DIMENSION and saved without any metadata. Animations are left alone.
+    """
+    try:
+        with Image.open(file) as image:
+            if getattr(image, "is_animated", False):
+                return None
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((MAX_DIMENSION, MAX_DIMENSION))
+            if image.mode not in ("RGB", "RGBA"):
+                has_alpha = "A" in image.getbands() or "transparency" in image.info
+                image = image.convert("RGBA" if has_alpha else "RGB")
+            output = io.BytesIO()
+            image.save(output, "WEBP", quality=WEBP_QUALITY)
+            return output.getvalue()
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def strip_metadata(image):
+    """Drop the metadata an image was read with, so that saving it does not copy it."""
+    image.info = {key: image.info[key] for key in KEPT_INFO if key in image.info}
+    return image
+
+
+def make_stripped(file):
+    """Encode a copy of an image in its own format without any metadata.
+
+    The copy is rotated as the EXIF orientation says, since the orientation
+    goes with the rest of the EXIF data. JPEGs keep their quantization tables
+    and subsampling. Returns None for animations and files that cannot be
+    decoded.
+    """
+    try:
+        with Image.open(file) as image:
+            if getattr(image, "is_animated", False):
+                return None
+            image_format = image.format
+            options = {"quality": "keep"} if image_format == "JPEG" else {}
+            # In place, so that a JPEG keeps the tables "keep" reads
+            ImageOps.exif_transpose(image, in_place=True)
+            strip_metadata(image)
+            output = io.BytesIO()
+            image.save(output, image_format, **options)
+            return output.getvalue()
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def make_renditions(sha256):
+    """Read the dimensions of a stored image and store its WebP and stripped renditions.
+
+    Returns the Image fields for them.
+    """
+    width, height = get_dimensions(path(sha256))
+    webp = make_webp(path(sha256))
+    stripped = make_stripped(path(sha256))
+    return {
+        "width": width,
+        "height": height,
+        "webp_sha256": save(webp) if webp else "",
+        "webp_size": len(webp) if webp else 0,
+        "stripped_sha256": save(stripped) if stripped else "",
+    }
+
+
+def variant_path(sha256, width, image_format):
+    root = Path(settings.IMAGE_VARIANT_ROOT)
+    return root / sha256[:2] / f"{sha256}-{width}.{image_format.lower()}"
+
+
+def open_variant(sha256, width, image_format):
+    """Open a variant of a stored image resized to width, making it on first use.
+
+    Variants live in a disk cache separate from the store, trimmed to
+    IMAGE_VARIANT_CACHE_SIZE bytes by evicting the least recently used. The
+    file is returned open, so that eviction by another request cannot remove
+    it before it is sent. Returns None for images that cannot be resized.
+    """
+    destination = variant_path(sha256, width, image_format)
+    try:
+        f = open(destination, "rb")  # noqa: SIM115
+    except FileNotFoundError:
+        pass
+    else:
+        # Modification time marks when a variant was last used
+        os.utime(destination)
+        return f
+
+    with caching.lock(str(destination)):
+        if not destination.exists():
+            try:
+                with Image.open(path(sha256)) as image:
+                    if getattr(image, "is_animated", False):
+                        return None
+                    image = strip_metadata(ImageOps.exif_transpose(image))
+                    image.thumbnail((width, image.height))
+                    has_alpha = "A" in image.getbands() or "transparency" in image.info
+                    if image_format == "JPEG" or not has_alpha:
+                        image = image.convert("RGB")
+                    elif image.mode != "RGBA":
+                        image = image.convert("RGBA")
+                    output = io.BytesIO()
+                    image.save(output, image_format, quality=VARIANT_QUALITY)
+            except (UnidentifiedImageError, OSError):
+                return None
+            write(destination, output.getvalue())
+        f = open(destination, "rb")  # noqa: SIM115
+    evict_variants()
+    return f
+
+
+def evict_variants():
+    """Delete the least recently used variants until the cache fits its size limit."""
+    variants = []
+    for variant in Path(settings.IMAGE_VARIANT_ROOT).glob("*/*"):
+        try:
+            stat = variant.stat()
+        except FileNotFoundError:
+            continue
+        variants.append((stat.st_mtime, stat.st_size, variant))
+    total = sum(size for _, size, _ in variants)
+    for _, size, variant in sorted(variants):
+        if total <= settings.IMAGE_VARIANT_CACHE_SIZE:
+            break
+        variant.unlink(missing_ok=True)
+        total -= size
+
+
+def read(sha256):
+    return path(sha256).read_bytes()
+
+
+def delete(sha256):
+    path(sha256).unlink(missing_ok=True)
@@ -0,0 +1,215 @@
+import random
+import resource
+import statistics
+import tempfile
+import time
+from itertools import accumulate
+from pathlib import Path
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from main import bitmaps, choices, facets, views
+from main.forms import MemoryForm
+from main.models import Memory, MemoryTheme, Theme, split_comma_separated
+
+
+def long_tail(values):
+    """Get a function picking from values with Zipf weights, the first most often.
+
+    Free text answers are spread like this, a few common ones and a long tail
+    that only one or two memories share.
+    """
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(values) + 1)))
+    return lambda: random.choices(values, cum_weights=cum_weights)[0]
+
+
+def current_rss_mb():
+    """Get the resident set size of this process in MB (Linux only)."""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark index view latency and process RSS at growing memory counts, "
+        "in a temporary database and cache that are removed afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[1_000, 100_000, 1_000_000],
+            help="Memory counts to benchmark at (default: 1000 100000 1000000)",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=50,
+            help="Number of index requests per size (default: 50)",
+        )
+        parser.add_argument(
+            "--query",
+            default="",
+            help="Query string to request the index with, e.g. 'country=GB'",
+        )
+
+    def handle(self, *args, **options):
+        # The synthetic memories go in a database of their own, and the values
+        # cached for them in a cache of their own, never the site's
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            connection.settings_dict["TEST"]["NAME"] = str(directory / "db.sqlite3")
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            cache = {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": directory / "cache",
+            }
+            try:
+                with override_settings(CACHES={"default": cache}):
+                    self.benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def benchmark(self, options):
+        factory = RequestFactory()
+        path = "/?" + options["query"] if options["query"] else "/"
+        created = 0
+        for size in sorted(options["sizes"]):
+            self.populate(created, size)
+            created = size
+            start = time.perf_counter()
+            bitmaps.memory_index.build()
+            build_seconds = time.perf_counter() - start
+
+            timings = []
+            query_counts = []
+            for _ in range(options["requests"]):
+                request = factory.get(path)
+                request.user = AnonymousUser()
+                request.session = SessionBase()
+                request._messages = FallbackStorage(request)
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    # Rendered every time, where views.index would serve all but
+                    # the first request from the page cache
+                    views.render_index(
+                        request, views.extract_filters_from_request(request)
+                    )
+                    timings.append((time.perf_counter() - start) * 1000)
+                query_counts.append(len(queries))
+
+            timings.sort()
+            p95 = timings[int((len(timings) - 1) * 0.95)]
+            indexed, scanned = self.time_theme_lookup("food")
+            self.stdout.write(
+                f"{size:>9} memories: "
+                f"mean {statistics.mean(timings):.1f}ms, "
+                f"p95 {p95:.1f}ms, "
+                f"queries {max(query_counts)}, "
+                f"rss {current_rss_mb():.1f}MB, "
+                f"bitmaps {bitmaps.memory_index.footprint() / (1024 * 1024):.1f}MB "
+                f"built in {build_seconds:.1f}s, "
+                f"theme lookup {indexed:.1f}ms indexed vs {scanned:.1f}ms by substring"
+            )
+
+    def populate(self, start, end):
+        """Bulk insert synthetic memories so that there are `end` in total.
+
+        Free text facets get a distinct value for about every 50 memories, so
+        that most of their options are rare ones, as on the live site.
+        """
+        tail = max(20, end // 50)
+        country = long_tail([code for code, _ in choices.COUNTRY_CHOICES])
+        genders = [code for code, _ in Memory.GENDER_CHOICES]
+        heritage = long_tail([f"Heritage {n}" for n in range(tail)])
+        grade = long_tail(
+            [f"Year {n}" for n in range(1, 14)] + [f"Grade {n}" for n in range(tail)]
+        )
+        funding = long_tail([code for code, _ in choices.SCHOOL_FUNDING_CHOICES])
+        funding_other = long_tail([f"Trust {n}" for n in range(tail)])
+        themes = [value for value, _ in MemoryForm.MEMORY_THEMES_CHOICES]
+        additional_theme = long_tail([f"Theme {n}" for n in range(tail)])
+        batch = []
+        for i in range(start, end):
+            school_funding = funding()
+            batch.append(
+                Memory(
+                    location="Somewhere",
+                    country=country(),
+                    gender=random.choice(genders),
+                    heritage=heritage(),
+                    school_grade=grade(),
+                    school_funding=school_funding,
+                    school_funding_other=(
+                        funding_other() if school_funding == "OTHER" else None
+                    ),
+                    memory_themes=",".join(random.sample(themes, random.randint(1, 3))),
+                    memory_themes_additional=(
+                        additional_theme() if random.random() < 0.3 else None
+                    ),
+                    title=f"Benchmark memory {i}",
+                    body="Lorem ipsum dolor sit amet. " * 40,
+                )
+            )
+            if len(batch) == 5000:
+                self.insert(batch)
+                batch = []
+        if batch:
+            self.insert(batch)
+        facets.rebuild()
+
+    def insert(self, batch):
+        """Bulk insert memories along with their theme links.
+
+        bulk_create skips save, so the facet keys and theme links are set here;
+        codes come from the field default.
+        """
+        for memory in batch:
+            memory.normalize()
+        Memory.objects.bulk_create(batch)
+        names = {
+            memory.id: split_comma_separated(memory.memory_themes)
+            + split_comma_separated(memory.memory_themes_additional)
+            for memory in batch
+        }
+        Theme.objects.bulk_create(
+            [Theme(name=name) for name in set().union(*names.values())],
+            ignore_conflicts=True,
+        )
+        theme_ids = dict(Theme.objects.values_list("name", "id"))
+        MemoryTheme.objects.bulk_create(
+            MemoryTheme(memory_id=memory_id, theme_id=theme_ids[name])
+            for memory_id, memory_names in names.items()
+            for name in dict.fromkeys(memory_names)
+        )
+
+    def time_theme_lookup(self, name):
+        """Time finding one theme's memories through its index and by substring."""
+        start = time.perf_counter()
+        list(
+            MemoryTheme.objects.filter(theme__name=name).values_list(
+                "memory_id", flat=True
+            )
+        )
+        indexed = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        list(
+            Memory.objects.filter(
+                Q(memory_themes__icontains=name)
+                | Q(memory_themes_additional__icontains=name)
+            ).values_list("id", flat=True)
+        )
+        scanned = (time.perf_counter() - start) * 1000
+        return indexed, scanned
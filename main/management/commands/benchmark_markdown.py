@@ -0,0 +1,64 @@
+import statistics
+import time
+
+import mistune
+from django.core.management.base import BaseCommand
+
+from main import markdown
+from main.models import Page, SiteSettings
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering markdown on every read, with a new parser each time, "
+        "against reading the HTML stored on save"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=1000,
+            help="Reads to time for each approach (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        site_settings = SiteSettings.objects.first()
+        texts = [page.body for page in Page.objects.all()]
+        if site_settings:
+            texts.append(site_settings.introduction)
+        texts = [text for text in texts if text]
+        if not texts:
+            texts = [
+                "# Title\n\nSome *markdown* with a [link](/) and a footnote[^1].\n\n[^1]: Note.\n"
+            ]
+        html = [markdown.to_html(text) for text in texts]
+
+        def per_request_parser():
+            for text in texts:
+                parser = mistune.create_markdown(plugins=["task_lists", "footnotes"])
+                parser(text)
+
+        def shared_parser():
+            for text in texts:
+                markdown.to_html(text)
+
+        def stored_html():
+            for value in html:
+                str(value)
+
+        self.stdout.write(f"{len(texts)} texts, {options['iterations']} reads each")
+        for name, read in (
+            ("new parser per read", per_request_parser),
+            ("shared parser per read", shared_parser),
+            ("stored html", stored_html),
+        ):
+            timings = []
+            for _ in range(options["iterations"]):
+                start = time.perf_counter()
+                read()
+                timings.append((time.perf_counter() - start) * 1_000_000)
+            self.stdout.write(
+                f"{name:>24}: mean {statistics.mean(timings):.1f}us, "
+                f"median {statistics.median(timings):.1f}us"
+            )
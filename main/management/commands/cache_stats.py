@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from main import caching
+
+# Key prefixes of the values cached with caching.get_or_compute
+PREFIXES = ("index_page", "filter_options", "page_list")
+
+
+class Command(BaseCommand):
+    help = "Show hits, misses, stale serves and coalesced waits of the shared cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after showing them",
+        )
+
+    def handle(self, *args, **options):
+        for prefix in PREFIXES:
+            stats = caching.stats(prefix)
+            total = sum(stats.values())
+            ratio = (total - stats["misses"]) / total if total else 0.0
+            self.stdout.write(
+                f"{prefix}: hits {stats['hits']}, misses {stats['misses']}, "
+                f"stale {stats['stale']}, coalesced {stats['coalesced']}, "
+                f"served from cache {ratio:.1%}"
+            )
+            if options["reset"]:
+                caching.reset_stats(prefix)
+        if options["reset"]:
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
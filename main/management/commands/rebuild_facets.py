@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main import facets
+from main.models import Facet
+
+
+class Command(BaseCommand):
+    help = "Recount the index filter facets from all memories"
+
+    def handle(self, *args, **options):
+        facets.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {Facet.objects.count()} facet values")
+        )
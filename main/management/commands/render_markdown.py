@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from main import caching
+from main.models import Page, SiteSettings
+
+
+class Command(BaseCommand):
+    help = "Re-render the stored HTML of pages and site settings from their markdown"
+
+    def handle(self, *args, **options):
+        pages = list(Page.objects.all())
+        for page in pages:
+            page.render_markdown()
+        # bulk_update leaves updated_at alone, the content itself did not change
+        Page.objects.bulk_update(pages, ["body_html"])
+
+        site_settings = list(SiteSettings.objects.all())
+        for instance in site_settings:
+            instance.render_markdown()
+        SiteSettings.objects.bulk_update(
+            site_settings,
+            ["introduction_html", "terms_of_service_html", "privacy_policy_html"],
+        )
+
+        # bulk_update sends no signals, so stale cached pages are dropped here
+        caching.bump("pages")
+        caching.bump("site_settings")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rendered {len(pages)} pages and {len(site_settings)} site settings"
+            )
+        )
@@ -0,0 +1,81 @@
+import contextvars
+import re
+
+import mistune
+from django.apps import apps
+from django.conf import settings
+from mistune.util import escape as escape_text
+from mistune.util import safe_entity, striptags
+
+from main import imagestore
+
+# Images uploaded here, linked as /images/<slug>.<extension> with or without one
+# of the site's own hosts, as the upload script inserts them
+LOCAL_IMAGE_RE = re.compile(
+    r"(?:https?://(?:{hosts})(?::\d+)?)?/images/(?P<slug>[\w-]+)\.(?P<extension>\w+)".format(
+        hosts="|".join(re.escape(host) for host in settings.ALLOWED_HOSTS)
+    )
+)
+
+# Width of the content column the images are shown in
+CONTENT_WIDTH = 1100
+
+# Metadata of the local images in the document being rendered, by slug
+local_images = contextvars.ContextVar("local_images", default=None)
+
+
+class HTMLRenderer(mistune.HTMLRenderer):
+    def image(self, text, url, title=None):
+        """Render local images lazily, with their intrinsic size and smaller variants."""
+        match = LOCAL_IMAGE_RE.fullmatch(url)
+        image = match and (local_images.get() or {}).get(match["slug"])
+        if not image or image["extension"] != match["extension"]:
+            return super().image(text, url, title)
+
+        src = self.safe_url(url)
+        html = f'<img src="{src}" alt="{escape_text(striptags(text))}"'
+        if title:
+            html += f' title="{safe_entity(title)}"'
+        html += ' loading="lazy" decoding="async"'
+        if image["width"] and image["height"]:
+            html += f' width="{image["width"]}" height="{image["height"]}"'
+        if image["webp_sha256"] and image["width"]:
+            candidates = [
+                f"{src}?w={width} {width}w"
+                for width in imagestore.VARIANT_WIDTHS
+                if width < image["width"]
+            ]
+            if candidates:
+                candidates.append(f"{src} {image['width']}w")
+                html += f' srcset="{", ".join(candidates)}"'
+                html += (
+                    f' sizes="(max-width: {CONTENT_WIDTH}px) 100vw, {CONTENT_WIDTH}px"'
+                )
+        return html + " />"
+
+
+# Built once per process, since creating a parser is most of the cost of
+# rendering a short text
+render = mistune.create_markdown(
+    renderer=HTMLRenderer(), plugins=["task_lists", "footnotes"]
+)
+
+
+def to_html(text):
+    """Render markdown, looking up all local images it embeds in a single query."""
+    text = text or ""
+    slugs = {match["slug"] for match in LOCAL_IMAGE_RE.finditer(text)}
+    images = {}
+    if slugs:
+        Image = apps.get_model("main", "Image")
+        images = {
+            image["slug"]: image
+            for image in Image.objects.filter(slug__in=slugs).values(
+                "slug", "extension", "width", "height", "webp_sha256"
+            )
+        }
+    token = local_images.set(images)
+    try:
+        return render(text)
+    finally:
+        local_images.reset(token)
@@ -0,0 +1,107 @@
+# Generated by Django 5.2 on 2026-10-18 00:08
+
+from collections import Counter
+
+from django.db import migrations, models
+
+# Frozen copy of the funding labels main.facets used when this migration was
+# written
+SCHOOL_FUNDING_LABELS = {
+    "GOVERNMENT_STATE": "Government/State",
+    "FAMILY": "Family",
+    "SCHOLARSHIP_DONATIONS": "Scholarship/Donations",
+    "OTHER": "Other",
+}
+
+
+def split_themes(themes_string):
+    if not themes_string:
+        return []
+    return [theme.strip() for theme in themes_string.split(",") if theme.strip()]
+
+
+def count_facets(apps, schema_editor):
+    """Count the facets as main.facets.rebuild did when this migration was written."""
+    from main.country import COUNTRIES
+
+    Memory = apps.get_model("main", "Memory")
+    Facet = apps.get_model("main", "Facet")
+    counts = Counter()
+    for memory in Memory.objects.only(
+        "country",
+        "heritage",
+        "school_grade",
+        "school_funding",
+        "school_funding_other",
+        "memory_themes",
+        "memory_themes_additional",
+    ).iterator():
+        values = {("country", memory.country, COUNTRIES.get(memory.country))}
+        if memory.heritage and memory.heritage.strip():
+            values.add(("heritage", memory.heritage, memory.heritage))
+        if memory.school_grade and memory.school_grade.strip():
+            values.add(("school_grade", memory.school_grade, memory.school_grade))
+        if memory.school_funding != "OTHER":
+            label = SCHOOL_FUNDING_LABELS.get(
+                memory.school_funding, memory.school_funding
+            )
+            values.add(("school_funding", memory.school_funding, label))
+        elif memory.school_funding_other and memory.school_funding_other.strip():
+            other = memory.school_funding_other
+            values.add(("school_funding", other, other))
+        for theme in split_themes(memory.memory_themes) + split_themes(
+            memory.memory_themes_additional
+        ):
+            values.add(("memory_theme", theme, theme))
+        counts.update(values)
+    Facet.objects.bulk_create(
+        Facet(facet=facet, value=value, label=label, count=count)
+        for (facet, value, label), count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0045_auto_20251021_0848"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Facet",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "facet",
+                    models.CharField(
+                        choices=[
+                            ("country", "Country"),
+                            ("heritage", "Heritage"),
+                            ("school_grade", "School grade"),
+                            ("school_funding", "School funding"),
+                            ("memory_theme", "Memory theme"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("value", models.CharField(max_length=500)),
+                ("label", models.CharField(max_length=500)),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("facet", "value"), name="facet_facet_value_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
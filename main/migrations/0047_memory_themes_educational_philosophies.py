@@ -0,0 +1,195 @@
+# Generated by Django 5.2 on 2026-10-18 00:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def split_comma_separated(value):
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def backfill_themes(apps, schema_editor):
+    """Fill the themes and philosophies tables from the comma-joined strings."""
+    Memory = apps.get_model("main", "Memory")
+    Theme = apps.get_model("main", "Theme")
+    EducationalPhilosophy = apps.get_model("main", "EducationalPhilosophy")
+    MemoryTheme = apps.get_model("main", "MemoryTheme")
+    MemoryEducationalPhilosophy = apps.get_model("main", "MemoryEducationalPhilosophy")
+
+    memory_themes = {}
+    memory_philosophies = {}
+    for memory in Memory.objects.only(
+        "memory_themes", "memory_themes_additional", "educational_philosophy"
+    ).iterator():
+        names = split_comma_separated(memory.memory_themes)
+        names += split_comma_separated(memory.memory_themes_additional)
+        memory_themes[memory.id] = set(names)
+        memory_philosophies[memory.id] = set(
+            split_comma_separated(memory.educational_philosophy)
+        )
+
+    Theme.objects.bulk_create(
+        [Theme(name=name) for name in set().union(*memory_themes.values())]
+    )
+    EducationalPhilosophy.objects.bulk_create(
+        [
+            EducationalPhilosophy(code=code)
+            for code in set().union(*memory_philosophies.values())
+        ]
+    )
+    theme_ids = dict(Theme.objects.values_list("name", "id"))
+    philosophy_ids = dict(EducationalPhilosophy.objects.values_list("code", "id"))
+
+    MemoryTheme.objects.bulk_create(
+        [
+            MemoryTheme(memory_id=memory_id, theme_id=theme_ids[name])
+            for memory_id, names in memory_themes.items()
+            for name in names
+        ],
+        batch_size=5000,
+    )
+    MemoryEducationalPhilosophy.objects.bulk_create(
+        [
+            MemoryEducationalPhilosophy(
+                memory_id=memory_id,
+                educational_philosophy_id=philosophy_ids[code],
+            )
+            for memory_id, codes in memory_philosophies.items()
+            for code in codes
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0046_facet"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EducationalPhilosophy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code", models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                "verbose_name_plural": "Educational philosophies",
+            },
+        ),
+        migrations.CreateModel(
+            name="Theme",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="MemoryEducationalPhilosophy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "educational_philosophy",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="main.educationalphilosophy",
+                    ),
+                ),
+                (
+                    "memory",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="main.memory"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="memory",
+            name="educational_philosophies",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="memories",
+                through="main.MemoryEducationalPhilosophy",
+                to="main.educationalphilosophy",
+            ),
+        ),
+        migrations.CreateModel(
+            name="MemoryTheme",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "memory",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="main.memory"
+                    ),
+                ),
+                (
+                    "theme",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="main.theme",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="memory",
+            name="themes",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="memories",
+                through="main.MemoryTheme",
+                to="main.theme",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="memoryeducationalphilosophy",
+            constraint=models.UniqueConstraint(
+                fields=("educational_philosophy", "memory"),
+                name="memoryeducationalphilosophy_philosophy_memory_unique",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="memorytheme",
+            constraint=models.UniqueConstraint(
+                fields=("theme", "memory"), name="memorytheme_theme_memory_unique"
+            ),
+        ),
+        migrations.RunPython(backfill_themes, migrations.RunPython.noop),
+    ]
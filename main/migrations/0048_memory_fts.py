@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from main import search
+
+    search.install()
+
+
+def uninstall_search_index(apps, schema_editor):
+    from main import search
+
+    search.uninstall()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0047_memory_themes_educational_philosophies"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
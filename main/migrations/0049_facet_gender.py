@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 00:20
+
+from collections import Counter
+
+from django.db import migrations, models
+
+# Frozen copy of the gender labels main.facets used when this migration was
+# written
+GENDER_LABELS = {
+    "BOY": "Boy",
+    "GIRL": "Girl",
+    "OTHER": "Other",
+    "PREFER_NOT_TO_SAY": "Prefer not to say",
+}
+
+
+def count_genders(apps, schema_editor):
+    """Count the gender facet, which is new here; the others are unchanged."""
+    Memory = apps.get_model("main", "Memory")
+    Facet = apps.get_model("main", "Facet")
+    counts = Counter(Memory.objects.values_list("gender", flat=True).iterator())
+    Facet.objects.filter(facet="gender").delete()
+    Facet.objects.bulk_create(
+        Facet(
+            facet="gender",
+            value=gender,
+            label=GENDER_LABELS.get(gender, gender),
+            count=count,
+        )
+        for gender, count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0048_memory_fts"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="facet",
+            name="facet",
+            field=models.CharField(
+                choices=[
+                    ("country", "Country"),
+                    ("gender", "Gender"),
+                    ("heritage", "Heritage"),
+                    ("school_grade", "School grade"),
+                    ("school_funding", "School funding"),
+                    ("memory_theme", "Memory theme"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.RunPython(count_genders, migrations.RunPython.noop),
+    ]
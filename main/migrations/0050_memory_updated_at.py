@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0049_facet_gender"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="memory",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
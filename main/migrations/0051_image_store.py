@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 00:50
+
+from django.db import migrations, models
+
+
+def extract_blobs(apps, schema_editor):
+    from main import imagestore
+
+    Image = apps.get_model("main", "Image")
+    for image in Image.objects.all().iterator(chunk_size=20):
+        data = bytes(image.data)
+        image.sha256 = imagestore.save(data)
+        image.size = len(data)
+        image.save(update_fields=["sha256", "size"])
+
+
+def restore_blobs(apps, schema_editor):
+    from main import imagestore
+
+    Image = apps.get_model("main", "Image")
+    for image in Image.objects.all().iterator(chunk_size=20):
+        image.data = imagestore.read(image.sha256)
+        image.save(update_fields=["data"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0050_memory_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="sha256",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=64
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="size",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        # Nullable while unapplying, until restore_blobs fills it back
+        migrations.AlterField(
+            model_name="image",
+            name="data",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(extract_blobs, restore_blobs),
+        migrations.RemoveField(
+            model_name="image",
+            name="data",
+        ),
+    ]
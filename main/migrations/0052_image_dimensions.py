@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 01:05
+
+from django.db import migrations, models
+
+
+def read_dimensions(apps, schema_editor):
+    from main import imagestore
+
+    Image = apps.get_model("main", "Image")
+    for image in Image.objects.all().iterator(chunk_size=100):
+        image.width, image.height = imagestore.get_dimensions(
+            imagestore.path(image.sha256)
+        )
+        image.save(update_fields=["width", "height"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0051_image_store"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="width",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="height",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(read_dimensions, migrations.RunPython.noop),
+    ]
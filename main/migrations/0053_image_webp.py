@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+def make_renditions(apps, schema_editor):
+    from main import imagestore
+
+    Image = apps.get_model("main", "Image")
+    for image in Image.objects.filter(webp_sha256="").iterator(chunk_size=100):
+        webp = imagestore.make_webp(imagestore.path(image.sha256))
+        if webp:
+            image.webp_sha256 = imagestore.save(webp)
+            image.webp_size = len(webp)
+            image.save(update_fields=["webp_sha256", "webp_size"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0052_image_dimensions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="webp_sha256",
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="webp_size",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(make_renditions, migrations.RunPython.noop),
+    ]
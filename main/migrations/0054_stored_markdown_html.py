@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-18 01:40
+
+import mistune
+from django.db import migrations, models
+
+
+def to_html(text):
+    """Frozen copy of main.markdown.to_html as it was when this migration was written.
+
+    Later versions look images up in the database, whose tables may not match
+    this migration's state. manage.py render_markdown re-renders with them.
+    """
+    return mistune.create_markdown(plugins=["task_lists", "footnotes"])(text or "")
+
+
+def render_markdown(apps, schema_editor):
+    Page = apps.get_model("main", "Page")
+    for page in Page.objects.all():
+        page.body_html = to_html(page.body)
+        page.save(update_fields=["body_html"])
+    SiteSettings = apps.get_model("main", "SiteSettings")
+    for site_settings in SiteSettings.objects.all():
+        site_settings.introduction_html = to_html(site_settings.introduction)
+        site_settings.terms_of_service_html = to_html(site_settings.terms_of_service)
+        site_settings.privacy_policy_html = to_html(site_settings.privacy_policy)
+        site_settings.save(
+            update_fields=[
+                "introduction_html",
+                "terms_of_service_html",
+                "privacy_policy_html",
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0053_image_webp"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="body_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="sitesettings",
+            name="introduction_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="sitesettings",
+            name="privacy_policy_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="sitesettings",
+            name="terms_of_service_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.RunPython(render_markdown, migrations.RunPython.noop),
+    ]
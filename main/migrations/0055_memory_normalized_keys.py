@@ -0,0 +1,129 @@
+# Generated by Django 5.2 on 2026-10-18 02:10
+
+import unicodedata
+from collections import Counter
+
+from django.db import migrations, models
+
+NORMALIZED_FIELDS = (
+    "location",
+    "gender_other",
+    "heritage",
+    "school_grade",
+    "school_funding_other",
+    "educational_philosophy_other",
+    "religious_tradition_other",
+)
+
+
+# Frozen copies of main.models.normalize_text and grouping_key
+def normalize_text(value):
+    if value is None:
+        return None
+    return " ".join(unicodedata.normalize("NFC", value).split())
+
+
+def grouping_key(value):
+    return unicodedata.normalize("NFC", normalize_text(value or "").casefold())
+
+
+def normalize_memories(apps, schema_editor):
+    Memory = apps.get_model("main", "Memory")
+    memories = list(Memory.objects.only(*NORMALIZED_FIELDS))
+    for memory in memories:
+        for field in NORMALIZED_FIELDS:
+            setattr(memory, field, normalize_text(getattr(memory, field)))
+        memory.heritage_key = grouping_key(memory.heritage)
+        memory.school_grade_key = grouping_key(memory.school_grade)
+        memory.school_funding_other_key = grouping_key(memory.school_funding_other)
+    Memory.objects.bulk_update(
+        memories,
+        [
+            *NORMALIZED_FIELDS,
+            "heritage_key",
+            "school_grade_key",
+            "school_funding_other_key",
+        ],
+        batch_size=500,
+    )
+
+
+def count_free_text_facets(apps, schema_editor):
+    """Recount the free text facets by grouping key, labelled with the most common spelling.
+
+    Country, gender and theme options do not change.
+    """
+    Memory = apps.get_model("main", "Memory")
+    Facet = apps.get_model("main", "Facet")
+    counts = Counter()
+    for memory in Memory.objects.only(
+        "heritage",
+        "heritage_key",
+        "school_grade",
+        "school_grade_key",
+        "school_funding",
+        "school_funding_other",
+        "school_funding_other_key",
+    ).iterator():
+        if memory.heritage_key:
+            counts[("heritage", memory.heritage_key, memory.heritage)] += 1
+        if memory.school_grade_key:
+            counts[("school_grade", memory.school_grade_key, memory.school_grade)] += 1
+        if memory.school_funding != "OTHER":
+            # The label of a choice is kept from the existing row
+            counts[("school_funding", memory.school_funding, None)] += 1
+        elif memory.school_funding_other_key:
+            counts[
+                (
+                    "school_funding",
+                    memory.school_funding_other_key,
+                    memory.school_funding_other,
+                )
+            ] += 1
+    choice_labels = dict(
+        Facet.objects.filter(facet="school_funding").values_list("value", "label")
+    )
+    options = {}
+    for (facet, value, label), count in counts.most_common():
+        if label is None:
+            label = choice_labels.get(value, value)
+        options.setdefault((facet, value), [label, 0])[1] += count
+    Facet.objects.filter(
+        facet__in=("heritage", "school_grade", "school_funding")
+    ).delete()
+    Facet.objects.bulk_create(
+        Facet(facet=facet, value=value, label=label, count=count)
+        for (facet, value), (label, count) in options.items()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0054_stored_markdown_html"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="memory",
+            name="heritage_key",
+            field=models.CharField(
+                blank=True, db_index=True, default="", editable=False, max_length=100
+            ),
+        ),
+        migrations.AddField(
+            model_name="memory",
+            name="school_grade_key",
+            field=models.CharField(
+                blank=True, db_index=True, default="", editable=False, max_length=16
+            ),
+        ),
+        migrations.AddField(
+            model_name="memory",
+            name="school_funding_other_key",
+            field=models.CharField(
+                blank=True, db_index=True, default="", editable=False, max_length=200
+            ),
+        ),
+        migrations.RunPython(normalize_memories, migrations.RunPython.noop),
+        migrations.RunPython(count_free_text_facets, migrations.RunPython.noop),
+    ]
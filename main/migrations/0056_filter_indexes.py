@@ -0,0 +1,63 @@
+# Generated by Django 5.2 on 2026-10-18 02:40
+
+from django.db import migrations, models
+
+import main.validators
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("main", "0055_memory_normalized_keys"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="image",
+            name="webp_sha256",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=64
+            ),
+        ),
+        migrations.AlterField(
+            model_name="page",
+            name="slug",
+            field=models.CharField(
+                db_index=True,
+                help_text="Lowercase letters, numbers, and - (hyphen) allowed.",
+                max_length=300,
+                validators=[main.validators.AlphanumericHyphenValidator()],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="memory",
+            index=models.Index(fields=["country"], name="memory_country_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="memory",
+            index=models.Index(fields=["age"], name="memory_age_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="memory",
+            index=models.Index(fields=["gender"], name="memory_gender_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="memory",
+            index=models.Index(fields=["school_grade"], name="memory_school_grade_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="memory",
+            index=models.Index(
+                fields=["school_funding", "school_funding_other_key"],
+                name="memory_school_funding_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_superuser", True)),
+                fields=["id"],
+                name="user_superuser_idx",
+            ),
+        ),
+    ]
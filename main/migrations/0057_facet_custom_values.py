@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 03:05
+
+from django.db import migrations
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+# Frozen copies of the funding choices and custom prefix of main.facets
+SCHOOL_FUNDING_CHOICES = (
+    "GOVERNMENT_STATE",
+    "FAMILY",
+    "SCHOLARSHIP_DONATIONS",
+    "OTHER",
+)
+CUSTOM_PREFIX = "custom:"
+
+
+def prefix_custom_values(apps, schema_editor):
+    """Move the custom funding options, grouping keys until now, behind CUSTOM_PREFIX."""
+    Facet = apps.get_model("main", "Facet")
+    Facet.objects.filter(facet="school_funding").exclude(
+        value__in=SCHOOL_FUNDING_CHOICES
+    ).exclude(value__startswith=CUSTOM_PREFIX).update(
+        value=Concat(Value(CUSTOM_PREFIX), "value")
+    )
+
+
+def unprefix_custom_values(apps, schema_editor):
+    Facet = apps.get_model("main", "Facet")
+    Facet.objects.filter(
+        facet="school_funding", value__startswith=CUSTOM_PREFIX
+    ).update(value=Substr("value", len(CUSTOM_PREFIX) + 1))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0056_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(prefix_custom_values, unprefix_custom_values),
+    ]
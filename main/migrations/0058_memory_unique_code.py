@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 03:30
+
+import secrets
+
+from django.db import migrations, models
+from django.db.models import Q
+
+import main.models
+
+
+def generate_code():
+    """Frozen copy of main.models.generate_code."""
+    alphabet = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+    code = "".join(secrets.choice(alphabet) for _ in range(8))
+    return f"{code[:4]}-{code[4:]}"
+
+
+def fill_missing_codes(apps, schema_editor):
+    """Give memories without a code one, never repeating a code in use.
+
+    A clash would make the unique constraint below fail, however unlikely.
+    """
+    Memory = apps.get_model("main", "Memory")
+    taken = set(Memory.objects.exclude(code=None).values_list("code", flat=True))
+    for memory in Memory.objects.filter(Q(code__isnull=True) | Q(code="")):
+        memory.code = generate_code()
+        while memory.code in taken:
+            memory.code = generate_code()
+        taken.add(memory.code)
+        memory.save(update_fields=["code"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0057_facet_custom_values"),
+    ]
+
+    operations = [
+        # Memories whose second save failed were left without a code
+        migrations.RunPython(fill_missing_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="memory",
+            name="code",
+            field=models.CharField(
+                default=main.models.generate_code,
+                editable=False,
+                max_length=20,
+                unique=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-18 01:11
+
+import io
+
+from django.db import migrations, models
+from PIL import Image as PILImage
+from PIL import ImageOps, UnidentifiedImageError
+
+# Frozen copies of what main.imagestore kept and how it encoded stripped copies
+# when this migration was written
+KEPT_INFO = ("icc_profile", "transparency", "background")
+
+
+def make_stripped(file):
+    try:
+        with PILImage.open(file) as image:
+            if getattr(image, "is_animated", False):
+                return None
+            image_format = image.format
+            options = {"quality": "keep"} if image_format == "JPEG" else {}
+            ImageOps.exif_transpose(image, in_place=True)
+            image.info = {
+                key: image.info[key] for key in KEPT_INFO if key in image.info
+            }
+            output = io.BytesIO()
+            image.save(output, image_format, **options)
+            return output.getvalue()
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def strip_images(apps, schema_editor):
+    from main import imagestore
+
+    Image = apps.get_model("main", "Image")
+    for image in Image.objects.filter(stripped_sha256="").iterator(chunk_size=100):
+        stripped = make_stripped(imagestore.path(image.sha256))
+        if stripped:
+            image.stripped_sha256 = imagestore.save(stripped)
+            image.save(update_fields=["stripped_sha256"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0058_memory_unique_code"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="stripped_sha256",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=64
+            ),
+        ),
+        migrations.RunPython(strip_images, migrations.RunPython.noop),
+    ]
@@ -1,47 +1,55 @@
-import base64
-import random
+import copy
+import secrets
+import unicodedata
 
-import mistune
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.urls import reverse
 
-from main import country, validators
+from main import caching, choices, imagestore, markdown, validators
 
 
 class SiteSettings(models.Model):
     introduction = models.TextField(blank=True, null=True)
     terms_of_service = models.TextField(blank=True, null=True)
     privacy_policy = models.TextField(blank=True, null=True)
+    # Rendered from the markdown above on save
+    introduction_html = models.TextField(blank=True, default="", editable=False)
+    terms_of_service_html = models.TextField(blank=True, default="", editable=False)
+    privacy_policy_html = models.TextField(blank=True, default="", editable=False)
 
-    @property
-    def introduction_as_html(self):
-        markdown = mistune.create_markdown(plugins=["task_lists", "footnotes"])
-        return markdown(self.introduction)
-
-    @property
-    def terms_of_service_as_html(self):
-        markdown = mistune.create_markdown(plugins=["task_lists", "footnotes"])
-        return markdown(self.terms_of_service)
-
-    @property
-    def privacy_policy_as_html(self):
-        markdown = mistune.create_markdown(plugins=["task_lists", "footnotes"])
-        return markdown(self.privacy_policy)
+    # Loaded instance with the generation it was read at, kept for each process
+    _loaded = None
 
     class Meta:
         verbose_name_plural = "Site Settings"
 
+    def render_markdown(self):
+        self.introduction_html = markdown.to_html(self.introduction)
+        self.terms_of_service_html = markdown.to_html(self.terms_of_service)
+        self.privacy_policy_html = markdown.to_html(self.privacy_policy)
+
     def save(self, *args, **kwargs):
         # Ensure only one instance exists
         self.pk = 1
+        self.render_markdown()
         super().save(*args, **kwargs)
 
     @classmethod
     def load(cls):
-        obj, created = cls.objects.get_or_create(pk=1)
-        return obj
+        """Get the settings, read from the database once per process until saved.
+
+        Never writes: until the settings are first saved this is an unsaved
+        instance, which saving creates. Each caller gets its own copy, so an
+        update view can change it without affecting other requests.
+        """
+        (generation,) = caching.get_generations("site_settings")
+        if cls._loaded is None or cls._loaded[0] != generation:
+            # The generation is read first, so a save during the query leaves
+            # the instance stale and it is read again on the next call
+            cls._loaded = (generation, cls.objects.filter(pk=1).first() or cls(pk=1))
+        return copy.copy(cls._loaded[1])
 
 
 class User(AbstractUser):
@@ -57,6 +65,18 @@ class User(AbstractUser):
     )
     email = models.EmailField(unique=True)
 
+    class Meta(AbstractUser.Meta):
+        # Superusers are looked up to email them about contact and memory submissions
+        # A partial index, since the lookup tests the flag itself rather than
+        # comparing it to a value
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_superuser=True),
+                name="user_superuser_idx",
+            )
+        ]
+
     def __str__(self):
         return self.username
 
@@ -66,16 +86,21 @@ class Page(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     slug = models.CharField(
         max_length=300,
+        db_index=True,
         validators=[validators.AlphanumericHyphenValidator()],
         help_text="Lowercase letters, numbers, and - (hyphen) allowed.",
     )
     title = models.CharField(max_length=300)
     body = models.TextField(blank=True, null=True)
+    # Rendered from body on save
+    body_html = models.TextField(blank=True, default="", editable=False)
 
-    @property
-    def body_as_html(self):
-        markdown = mistune.create_markdown(plugins=["task_lists", "footnotes"])
-        return markdown(self.body)
+    def render_markdown(self):
+        self.body_html = markdown.to_html(self.body)
+
+    def save(self, *args, **kwargs):
+        self.render_markdown()
+        super().save(*args, **kwargs)
 
     def get_absolute_url(self):
         path = reverse("page_detail", kwargs={"slug": self.slug})
@@ -88,7 +113,21 @@ class Page(models.Model):
 class Image(models.Model):
     name = models.CharField(max_length=300)  # original filename
     slug = models.CharField(max_length=300, unique=True)
-    data = models.BinaryField()
+    # Contents are kept on disk in main.imagestore, under their digest
+    sha256 = models.CharField(max_length=64, db_index=True, editable=False)
+    size = models.PositiveIntegerField(default=0, editable=False)
+    width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    height = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    # Downscaled WebP rendition without metadata, served to browsers that accept it
+    webp_sha256 = models.CharField(
+        max_length=64, blank=True, editable=False, db_index=True
+    )
+    webp_size = models.PositiveIntegerField(default=0, editable=False)
+    # Copy in the original format without metadata such as EXIF location, served
+    # to browsers that do not accept WebP
+    stripped_sha256 = models.CharField(
+        max_length=64, blank=True, editable=False, db_index=True
+    )
     extension = models.CharField(max_length=10)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
@@ -97,13 +136,13 @@ class Image(models.Model):
         return self.slug + "." + self.extension
 
     @property
-    def data_as_base64(self):
-        return base64.b64encode(self.data).decode("utf-8")
+    def path(self):
+        return imagestore.path(self.sha256)
 
     @property
     def data_size(self):
         """Get image size in MB."""
-        return round(len(self.data) / (1024 * 1024), 2)
+        return round(self.size / (1024 * 1024), 2)
 
     def get_raw_absolute_url(self):
         path = reverse(
@@ -119,60 +158,137 @@ class Image(models.Model):
         return self.name
 
 
+def normalize_text(value):
+    """Clean up free text as typed: NFC-normalize, trim and collapse whitespace."""
+    if value is None:
+        return None
+    return " ".join(unicodedata.normalize("NFC", value).split())
+
+
+def grouping_key(value):
+    """Get the key grouping spellings of free text that differ only in case or spacing."""
+    return unicodedata.normalize("NFC", normalize_text(value or "").casefold())
+
+
+# Crockford's base32, without letters easily mistaken for digits
+CODE_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+CODE_LENGTH = 8
+
+# Inserts retried with a new code when the code is taken, which with 32^8
+# possible codes is next to never
+CODE_ATTEMPTS = 3
+
+
+def generate_code():
+    """Generate a random memory code, such as 7KQ2-M9XD, independent of the id."""
+    code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+    return f"{code[:4]}-{code[4:]}"
+
+
+# Memory fields mirrored into the theme and philosophy tables
+THEME_FIELDS = ("memory_themes", "memory_themes_additional", "educational_philosophy")
+
+
+def sync_links(
+    memory, link_model, value_model, link_field, value_field, values, created
+):
+    """Link a memory to exactly the given values, creating the values that are new.
+
+    A new memory has no links to read first. Values are looked up in one query,
+    and only inserted, then looked up again, when some do not exist yet.
+    """
+    values = list(dict.fromkeys(values))
+    linked = {}
+    if not created:
+        linked = dict(
+            link_model.objects.filter(memory=memory).values_list(
+                f"{link_field}__{value_field}", "id"
+            )
+        )
+    missing = [value for value in values if value not in linked]
+    if missing:
+        lookup = value_model.objects.filter(**{f"{value_field}__in": missing})
+        ids = dict(lookup.values_list(value_field, "id"))
+        if len(ids) < len(missing):
+            value_model.objects.bulk_create(
+                [value_model(**{value_field: value}) for value in missing],
+                ignore_conflicts=True,
+            )
+            ids = dict(lookup.values_list(value_field, "id"))
+        link_model.objects.bulk_create(
+            [
+                link_model(memory=memory, **{f"{link_field}_id": ids[value]})
+                for value in missing
+            ]
+        )
+    unlinked = [link_id for value, link_id in linked.items() if value not in values]
+    if unlinked:
+        link_model.objects.filter(id__in=unlinked).delete()
+
+
+def split_comma_separated(value):
+    """Split a comma-joined string, as stored for themes and philosophies, into a list."""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class Theme(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class EducationalPhilosophy(models.Model):
+    code = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.code
+
+    class Meta:
+        verbose_name_plural = "Educational philosophies"
+
+
 class Memory(models.Model):
-    COUNTRY_CHOICES = [(code, name) for code, name in country.COUNTRIES.items()]
+    COUNTRY_CHOICES = choices.COUNTRY_CHOICES
     location = models.CharField(max_length=200, help_text="City/town/village")
     country = models.CharField(max_length=2, choices=COUNTRY_CHOICES)
-    age = models.IntegerField(choices=[(i, str(i)) for i in range(1, 19)], default=10)
-    GENDER_CHOICES = [
-        ("BOY", "Boy"),
-        ("GIRL", "Girl"),
-        ("OTHER", "Other"),
-        ("PREFER_NOT_TO_SAY", "Prefer not to say"),
-    ]
+    age = models.IntegerField(choices=choices.AGE_CHOICES, default=10)
+    GENDER_CHOICES = choices.GENDER_CHOICES
     gender = models.CharField(
         max_length=20, choices=GENDER_CHOICES, default="PREFER_NOT_TO_SAY"
     )
     gender_other = models.CharField(max_length=100, blank=True, null=True)
     heritage = models.CharField(max_length=100)
+    heritage_key = models.CharField(
+        max_length=100, blank=True, default="", editable=False, db_index=True
+    )
     school_grade = models.CharField(max_length=16)
-    SCHOOL_FUNDING_CHOICES = [
-        ("GOVERNMENT_STATE", "Government/State"),
-        ("FAMILY", "Family"),
-        ("SCHOLARSHIP_DONATIONS", "Scholarship/Donations"),
-        ("OTHER", "Other"),
-    ]
+    school_grade_key = models.CharField(
+        max_length=16, blank=True, default="", editable=False, db_index=True
+    )
+    SCHOOL_FUNDING_CHOICES = choices.SCHOOL_FUNDING_CHOICES
     school_funding = models.CharField(
         max_length=100, choices=SCHOOL_FUNDING_CHOICES, default="GOVERNMENT_STATE"
     )
     school_funding_other = models.CharField(max_length=200, blank=True, null=True)
-    EDUCATIONAL_PHILOSOPHY_CHOICES = [
-        ("MONTESSORI", "Montessori"),
-        ("WALDORF", "Waldorf"),
-        ("REGGIO_EMILIA", "Reggio Emilia"),
-        ("PROGRESSIVE", "Progressive"),
-        ("INTERNATIONAL_BACCALAUREATE", "International Baccalaureate"),
-        ("FOREST_SCHOOL", "Forest School"),
-        ("HOMESCHOOLING", "Homeschooling"),
-        ("DOES_NOT_APPLY", "Does not apply"),
-        ("OTHER", "Other"),
-    ]
+    school_funding_other_key = models.CharField(
+        max_length=200, blank=True, default="", editable=False, db_index=True
+    )
+    EDUCATIONAL_PHILOSOPHY_CHOICES = choices.EDUCATIONAL_PHILOSOPHY_CHOICES
     educational_philosophy = models.CharField(max_length=500, blank=True, null=True)
     educational_philosophy_other = models.CharField(
         max_length=200, blank=True, null=True
     )
-    RELIGIOUS_TRADITION_CHOICES = [
-        ("QUAKER", "Quaker"),
-        ("CATHOLIC", "Catholic"),
-        ("PROTESTANT_CHRISTIAN", "Protestant/Christian"),
-        ("JEWISH", "Jewish"),
-        ("MUSLIM", "Muslim"),
-        ("HINDU", "Hindu"),
-        ("BUDDHIST", "Buddhist"),
-        ("GREEK_ORTHODOX", "Greek Orthodox"),
-        ("DOES_NOT_APPLY", "Does not apply"),
-        ("OTHER", "Other"),
-    ]
+    # Indexed copy of educational_philosophy, used for filtering
+    educational_philosophies = models.ManyToManyField(
+        EducationalPhilosophy,
+        through="MemoryEducationalPhilosophy",
+        related_name="memories",
+        blank=True,
+    )
+    RELIGIOUS_TRADITION_CHOICES = choices.RELIGIOUS_TRADITION_CHOICES
     religious_tradition = models.CharField(
         max_length=100, choices=RELIGIOUS_TRADITION_CHOICES, blank=True, null=True
     )
@@ -183,28 +299,39 @@ class Memory(models.Model):
         blank=True,
         null=True,
     )
+    # Indexed copy of memory_themes and memory_themes_additional, used for filtering
+    themes = models.ManyToManyField(
+        Theme, through="MemoryTheme", related_name="memories", blank=True
+    )
     title = models.CharField(max_length=100)
     body = models.TextField("Memory content")
-    code = models.CharField(max_length=20, blank=True, null=True)
+    # Set when the memory is created, so that it is inserted in one write
+    code = models.CharField(
+        max_length=20, unique=True, default=generate_code, editable=False
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_country_display(self):
+        return choices.label("country", self.country)
+
+    def get_gender_display(self):
+        return choices.label("gender", self.gender)
 
     def get_school_funding_display(self):
         if self.school_funding == "OTHER" and self.school_funding_other:
             return self.school_funding_other
-        choices = dict(self.SCHOOL_FUNDING_CHOICES)
-        return choices.get(self.school_funding, self.school_funding)
+        return choices.label("school_funding", self.school_funding)
 
     def get_educational_philosophy_display(self):
         if not self.educational_philosophy:
             return "Not specified"
-        philosophies = self.educational_philosophy.split(",")
+        philosophies = split_comma_separated(self.educational_philosophy)
         display_names = []
         for phil in philosophies:
-            phil = phil.strip()
             if phil == "OTHER" and self.educational_philosophy_other:
                 display_names.append(self.educational_philosophy_other)
             else:
-                choices = dict(self.EDUCATIONAL_PHILOSOPHY_CHOICES)
-                display_names.append(choices.get(phil, phil))
+                display_names.append(choices.label("educational_philosophy", phil))
         return ", ".join(display_names)
 
     def get_religious_tradition_display(self):
@@ -212,24 +339,163 @@ class Memory(models.Model):
             return "Not specified"
         if self.religious_tradition == "OTHER" and self.religious_tradition_other:
             return self.religious_tradition_other
-        choices = dict(self.RELIGIOUS_TRADITION_CHOICES)
-        return choices.get(self.religious_tradition, self.religious_tradition)
+        return choices.label("religious_tradition", self.religious_tradition)
 
     def get_absolute_url(self):
         path = reverse("memory_detail", kwargs={"pk": self.pk})
         return f"{settings.PROTOCOL}//{settings.CANONICAL_HOST}{path}"
 
+    # Free-text fields cleaned up on save, so that facets and filters never
+    # have to trim or compare them at read time
+    NORMALIZED_FIELDS = (
+        "location",
+        "gender_other",
+        "heritage",
+        "school_grade",
+        "school_funding_other",
+        "educational_philosophy_other",
+        "religious_tradition_other",
+    )
+
+    def normalize(self):
+        """Clean up the free-text fields and set the grouping keys of the faceted ones."""
+        for field in self.NORMALIZED_FIELDS:
+            setattr(self, field, normalize_text(getattr(self, field)))
+        self.heritage_key = grouping_key(self.heritage)
+        self.school_grade_key = grouping_key(self.school_grade)
+        self.school_funding_other_key = grouping_key(self.school_funding_other)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The link tables match the strings as loaded, unless some were deferred
+        if set(THEME_FIELDS) <= set(field_names):
+            instance._synced_themes = instance.theme_strings()
+        return instance
+
+    def theme_strings(self):
+        return tuple(getattr(self, field) for field in THEME_FIELDS)
+
+    def sync_themes(self, created):
+        """Mirror the comma-joined theme and philosophy strings into their tables.
+
+        Skipped when the strings are unchanged since the memory was loaded.
+        """
+        strings = self.theme_strings()
+        synced = getattr(self, "_synced_themes", None) or (None,) * len(strings)
+        if strings[:2] != synced[:2]:
+            names = split_comma_separated(self.memory_themes)
+            names += split_comma_separated(self.memory_themes_additional)
+            sync_links(self, MemoryTheme, Theme, "theme", "name", names, created)
+        if strings[2] != synced[2]:
+            sync_links(
+                self,
+                MemoryEducationalPhilosophy,
+                EducationalPhilosophy,
+                "educational_philosophy",
+                "code",
+                split_comma_separated(self.educational_philosophy),
+                created,
+            )
+        self._synced_themes = strings
+
     def save(self, *args, **kwargs):
-        # Save first to get the ID
-        super().save(*args, **kwargs)
-        # Generate code if it doesn't exist
-        if not self.code:
-            random_num = random.randint(100, 999)
-            self.code = f"{self.id}-{random_num}"
-            super().save(update_fields=["code"])
+        self.normalize()
+        created = self._state.adding
+        with transaction.atomic():
+            for attempt in range(CODE_ATTEMPTS):
+                try:
+                    # A savepoint, so that a taken code can be retried
+                    with transaction.atomic():
+                        super().save(*args, **kwargs)
+                    break
+                except IntegrityError:
+                    # Only a clash on the code is retried, any other constraint
+                    # would fail again with a new code
+                    if (
+                        not created
+                        or attempt == CODE_ATTEMPTS - 1
+                        or not Memory.objects.filter(code=self.code).exists()
+                    ):
+                        raise
+                    self.code = generate_code()
+            self.sync_themes(created)
 
     def __str__(self):
         return self.title
 
     class Meta:
         verbose_name_plural = "Memories"
+        # One per admin filter; SQLite keeps the id in every index, so each
+        # also serves the filtered changelist newest first without a sort
+        indexes = [
+            models.Index(fields=["country"], name="memory_country_idx"),
+            models.Index(fields=["age"], name="memory_age_idx"),
+            models.Index(fields=["gender"], name="memory_gender_idx"),
+            # Also covers the DISTINCT scan listing grades in the admin filter
+            models.Index(fields=["school_grade"], name="memory_school_grade_idx"),
+            # Predefined funding alone, or OTHER together with the custom value
+            models.Index(
+                fields=["school_funding", "school_funding_other_key"],
+                name="memory_school_funding_idx",
+            ),
+        ]
+
+
+class MemoryTheme(models.Model):
+    memory = models.ForeignKey(Memory, on_delete=models.CASCADE)
+    # Indexed together with memory below, so that filtering by theme walks
+    # memories in id order without a sort
+    theme = models.ForeignKey(Theme, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["theme", "memory"], name="memorytheme_theme_memory_unique"
+            )
+        ]
+
+
+class MemoryEducationalPhilosophy(models.Model):
+    memory = models.ForeignKey(Memory, on_delete=models.CASCADE)
+    educational_philosophy = models.ForeignKey(
+        EducationalPhilosophy, on_delete=models.CASCADE, db_index=False
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["educational_philosophy", "memory"],
+                name="memoryeducationalphilosophy_philosophy_memory_unique",
+            )
+        ]
+
+
+class Facet(models.Model):
+    """Number of memories behind each option of the index filter dropdowns.
+
+    Kept up to date by signals on Memory; rebuild with `manage.py rebuild_facets`.
+    """
+
+    FACET_CHOICES = [
+        ("country", "Country"),
+        ("gender", "Gender"),
+        ("heritage", "Heritage"),
+        ("school_grade", "School grade"),
+        ("school_funding", "School funding"),
+        ("memory_theme", "Memory theme"),
+    ]
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=500)
+    label = models.CharField(max_length=500)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.facet}: {self.label} ({self.count})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["facet", "value"], name="facet_facet_value_unique"
+            )
+        ]
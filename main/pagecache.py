@@ -0,0 +1,43 @@
+import hashlib
+import json
+
+from django.conf import settings
+
+from main import caching
+
+KEY_PREFIX = "index_page"
+
+# Model changes the index page shows
+NAMESPACES = ("memories", "pages", "site_settings")
+
+# Entries go stale on any change anyway, this only bounds unused ones
+TIMEOUT = 60 * 60 * 24
+
+
+def is_cacheable(request):
+    """Check whether the request gets the same page as every other anonymous visitor.
+
+    Without a session or messages cookie there is no logged in user and no
+    flash message to show, so the page depends on the query string alone.
+    """
+    return (
+        request.method == "GET"
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and "messages" not in request.COOKIES
+    )
+
+
+def get_or_render(params, render):
+    """Get the cached body of the page for the filter and cursor parameters, or render it.
+
+    Empty values are dropped and keys sorted, so that equivalent URLs share an entry.
+    """
+    canonical = {
+        name: sorted(value) if isinstance(value, list) else value
+        for name, value in sorted(params.items())
+        if value
+    }
+    digest = hashlib.sha256(
+        json.dumps(canonical, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return caching.get_or_compute((KEY_PREFIX, digest), render, NAMESPACES, TIMEOUT)
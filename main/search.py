@@ -0,0 +1,185 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+FTS_TABLE = "main_memory_fts"
+
+# Columns of main_memory indexed for full-text search, with their BM25 weights
+FTS_COLUMNS = {
+    "title": 10.0,
+    "body": 1.0,
+    "location": 2.0,
+    "memory_themes": 4.0,
+    "memory_themes_additional": 4.0,
+    "school_funding_other": 1.0,
+    "educational_philosophy_other": 1.0,
+    "religious_tradition_other": 1.0,
+}
+
+# Markers for highlighted terms, swapped for <mark> tags after escaping
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+SEARCH_PAGE_SIZE = 100
+
+# Most results ranked per search, so that a common word never has every match
+# read and sorted; ten pages' worth
+RANK_LIMIT = 10 * SEARCH_PAGE_SIZE
+
+# Shortest last word matched as a prefix, shorter ones are matched whole, since
+# a one or two letter prefix matches nearly every memory
+MIN_PREFIX_LENGTH = 3
+
+
+def install():
+    """Create the full-text index over memories and the triggers keeping it in sync.
+
+    Safe to run repeatedly. SQLite drops triggers whenever Django remakes the
+    main_memory table during a migration, so this runs after every migrate and
+    rebuilds the index if the triggers had to be recreated.
+    """
+    if connection.vendor != "sqlite":
+        return
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in FTS_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in FTS_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            [f"{FTS_TABLE}_%"],
+        )
+        needs_rebuild = cursor.fetchone()[0] < 3
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{columns}, content='main_memory', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert "
+            "AFTER INSERT ON main_memory BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); "
+            "END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete "
+            "AFTER DELETE ON main_memory BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values}); "
+            "END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update "
+            "AFTER UPDATE ON main_memory BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); "
+            "END"
+        )
+        if needs_rebuild:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall():
+    with connection.cursor() as cursor:
+        for trigger in ("insert", "delete", "update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query that ANDs every word, prefix-matching the last.
+
+    The last word is only a prefix from MIN_PREFIX_LENGTH characters. Words are
+    quoted so that user input can never be parsed as FTS5 syntax.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if len(words[-1]) >= MIN_PREFIX_LENGTH:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def filter_memories(queryset, text):
+    """Restrict a memory queryset to those matching the search text."""
+    match_query = build_match_query(text)
+    if not match_query:
+        return queryset.none()
+    return queryset.filter(
+        id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            (match_query,),
+        )
+    )
+
+
+def highlight(text):
+    return (
+        escape(text)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_END, "</mark>")
+    )
+
+
+def rank(text):
+    """Get the ids of the RANK_LIMIT memories best matching the search text, best BM25 rank first."""
+    match_query = build_match_query(text)
+    if not match_query:
+        return []
+    weights = ", ".join(str(weight) for weight in FTS_COLUMNS.values())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s",
+            [match_query, RANK_LIMIT],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def paginate_memories(text, ranked_ids, page_number=1):
+    """Return one page of the ranked search results.
+
+    Each memory comes with its title and a snippet of the best matching column,
+    both with the matched terms of the search text wrapped in <mark>.
+    """
+    page_number = max(page_number or 1, 1)
+    offset = (page_number - 1) * SEARCH_PAGE_SIZE
+    page_ids = ranked_ids[offset : offset + SEARCH_PAGE_SIZE]
+    highlights = {}
+    if page_ids:
+        placeholders = ", ".join(["%s"] * len(page_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, "
+                f"highlight({FTS_TABLE}, 0, %s, %s), "
+                f"snippet({FTS_TABLE}, -1, %s, %s, '…', 24) "
+                f"FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})",
+                [
+                    HIGHLIGHT_START,
+                    HIGHLIGHT_END,
+                    HIGHLIGHT_START,
+                    HIGHLIGHT_END,
+                    build_match_query(text),
+                    *page_ids,
+                ],
+            )
+            highlights = {rowid: (title, snippet) for rowid, title, snippet in cursor}
+
+    has_next = len(ranked_ids) > offset + SEARCH_PAGE_SIZE
+    return {
+        "memory_list": [
+            {
+                "id": memory_id,
+                "title_html": highlight(highlights[memory_id][0]),
+                "snippet_html": highlight(highlights[memory_id][1]),
+            }
+            for memory_id in page_ids
+            if memory_id in highlights
+        ],
+        "prev_page": page_number - 1 if page_number > 1 else None,
+        "next_page": page_number + 1 if has_next else None,
+    }
@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from main import bitmaps, caching, facets, imagestore, models, search
+
+
+@receiver(post_migrate)
+def install_search_index(sender, **kwargs):
+    if sender.name == "main":
+        search.install()
+
+
+@receiver(pre_save, sender=models.Memory)
+def remember_memory_facets(sender, instance, raw, **kwargs):
+    """Store the facets of a memory as they were before an update."""
+    instance._facets_before = set()
+    if instance.pk and not raw:
+        previous = sender.objects.filter(pk=instance.pk).first()
+        if previous:
+            instance._facets_before = facets.get_facet_values(previous)
+
+
+@receiver(post_save, sender=models.Memory)
+def update_memory_facets(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, "_facets_before", set())
+    after = facets.get_facet_values(instance)
+    facets.adjust_counts(before - after, -1)
+    facets.adjust_counts(after - before, 1)
+
+    # The bitmaps live in this process, so they only change once the save commits
+    def update_bitmaps():
+        bitmaps.memory_index.remove(instance.pk, before - after)
+        bitmaps.memory_index.add(instance.pk, after)
+
+    transaction.on_commit(update_bitmaps)
+    instance._facets_before = after
+
+
+@receiver(post_delete, sender=models.Memory)
+def remove_memory_facets(sender, instance, **kwargs):
+    values = facets.get_facet_values(instance)
+    facets.adjust_counts(values, -1)
+    memory_id = instance.pk
+    transaction.on_commit(
+        lambda: bitmaps.memory_index.remove(memory_id, values, keep=False)
+    )
+
+
+GENERATION_NAMESPACES = {
+    models.Memory: "memories",
+    models.Theme: "memories",
+    models.EducationalPhilosophy: "memories",
+    models.Page: "pages",
+    models.SiteSettings: "site_settings",
+    models.Image: "images",
+}
+
+
+def bump_generation(sender, **kwargs):
+    # After the commit, or another worker could cache the old data under the
+    # new generation
+    namespace = GENERATION_NAMESPACES[sender]
+    transaction.on_commit(lambda: caching.bump(namespace))
+
+
+for model in GENERATION_NAMESPACES:
+    post_save.connect(bump_generation, sender=model)
+    post_delete.connect(bump_generation, sender=model)
+
+
+@receiver(post_delete, sender=models.Image)
+def delete_image_file(sender, instance, **kwargs):
+    """Remove the stored files once no image uses them, after the delete commits."""
+
+    def delete_if_unused():
+        stored = (instance.sha256, instance.webp_sha256, instance.stripped_sha256)
+        for sha256 in filter(None, stored):
+            in_use = sender.objects.filter(
+                Q(sha256=sha256) | Q(webp_sha256=sha256) | Q(stripped_sha256=sha256)
+            ).exists()
+            if not in_use:
+                imagestore.delete(sha256)
+
+    transaction.on_commit(delete_if_unused)
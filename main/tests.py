@@ -0,0 +1,621 @@
+import fcntl
+import hashlib
+import io
+import re
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from main import bitmaps, caching, facets, imagestore, models, search, views
+
+COUNTRIES = ["GB", "US", "GR", "DE", "FR", "JP", "BR", "IN"]
+GENDERS = ["BOY", "GIRL", "OTHER", "PREFER_NOT_TO_SAY"]
+FUNDINGS = ["GOVERNMENT_STATE", "FAMILY", "SCHOLARSHIP_DONATIONS", "OTHER"]
+THEMES = ["break", "desk", "exams", "food", "friendships", "nature"]
+
+# Plan step reading every row of a table, as opposed to searching an index or
+# scanning a covering one
+FULL_SCAN_RE = re.compile(r"SCAN (?:TABLE )?(\w+)")
+
+
+def create_memories(count):
+    """Bulk insert memories spread over many options of every facet."""
+    memories = []
+    for i in range(count):
+        funding = FUNDINGS[i % len(FUNDINGS)]
+        memory = models.Memory(
+            location=f"Town {i % 5}",
+            country=COUNTRIES[i % len(COUNTRIES)],
+            gender=GENDERS[i % len(GENDERS)],
+            heritage=f"Heritage {i % 10}",
+            school_grade=f"Year {i % 12 + 1}",
+            school_funding=funding,
+            school_funding_other=f"Trust {i % 3}" if funding == "OTHER" else None,
+            memory_themes=f"{THEMES[i % 6]},{THEMES[(i + 1) % 6]}",
+            title=f"Memory {i}",
+            body=f"I remember school {i}.",
+        )
+        # bulk_create skips save, which sets the facet keys and theme links
+        memory.normalize()
+        memories.append(memory)
+    models.Memory.objects.bulk_create(memories)
+    for memory in memories:
+        memory.sync_themes(created=True)
+    facets.rebuild()
+
+
+def full_scans(sql):
+    """Get the tables the query plan of a statement reads in full."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [
+            match[1]
+            for row in cursor.fetchall()
+            if (match := FULL_SCAN_RE.fullmatch(row[-1]))
+        ]
+
+
+class CacheTestCase(TestCase):
+    """Test case with a cache of its own, so tests never see the site's cached pages."""
+
+    @classmethod
+    def setUpClass(cls):
+        directory = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(
+            override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                        "LOCATION": directory,
+                    }
+                }
+            )
+        )
+        super().setUpClass()
+
+    def setUp(self):
+        # Test transactions are rolled back without committing, so the signals
+        # never update the index of this process
+        bitmaps.memory_index.build()
+
+
+class GetOrComputeTests(CacheTestCase):
+    def stripe(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % caching.LOCK_STRIPES
+
+    def hold_stripe(self, key):
+        """Lock a key's stripe through a file of its own, as another worker would."""
+        directory = Path(settings.CACHES["default"]["LOCATION"]) / "locks"
+        directory.mkdir(parents=True, exist_ok=True)
+        f = open(directory / f"{self.stripe(key)}.lock", "a")  # noqa: SIM115
+        self.addCleanup(f.close)
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_nested_compute_does_not_wait_for_busy_stripe(self):
+        inner = next(
+            f"inner{i}"
+            for i in range(100)
+            if self.stripe(f"inner{i}") != self.stripe("outer")
+        )
+        self.hold_stripe(inner)
+
+        def compute_outer():
+            return caching.get_or_compute([inner], lambda: "inner value", ("memories",))
+
+        start = time.monotonic()
+        value = caching.get_or_compute(["outer"], compute_outer, ("memories",))
+        self.assertEqual(value, "inner value")
+        self.assertLess(time.monotonic() - start, caching.LOCK_TIMEOUT / 2)
+
+    def test_stale_value_served_while_stripe_is_busy(self):
+        caching.get_or_compute(["key"], lambda: "old", ("memories",))
+        caching.bump("memories")
+        self.hold_stripe("key")
+        self.addCleanup(caching.served_stale.set, False)
+        self.assertEqual(
+            caching.get_or_compute(["key"], lambda: "new", ("memories",)), "old"
+        )
+        self.assertTrue(caching.served_stale.get())
+
+
+class FacetCountTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_memories(10)
+
+    def assert_counts_match_rebuild(self):
+        counts = set(models.Facet.objects.values_list("facet", "value", "count"))
+        facets.rebuild()
+        self.assertEqual(
+            counts, set(models.Facet.objects.values_list("facet", "value", "count"))
+        )
+
+    def test_counts_follow_saves_and_deletes(self):
+        memory = models.Memory.objects.create(
+            location="Town",
+            country="GB",
+            heritage="New heritage",
+            school_grade="Year 3",
+            school_funding="OTHER",
+            school_funding_other="New trust",
+            memory_themes="food,desk",
+            title="New",
+            body="New memory.",
+        )
+        self.assert_counts_match_rebuild()
+        memory.heritage = "Heritage 1"
+        memory.school_funding = "FAMILY"
+        memory.save()
+        self.assert_counts_match_rebuild()
+        memory.delete()
+        self.assert_counts_match_rebuild()
+        self.assertFalse(models.Facet.objects.filter(value="new heritage").exists())
+
+    def test_queries_do_not_grow_with_values(self):
+        def queries(count):
+            values = {("heritage", f"bulk {i}", f"Bulk {i}") for i in range(count)}
+            with CaptureQueriesContext(connection) as added:
+                facets.adjust_counts(values, 1)
+            with CaptureQueriesContext(connection) as removed:
+                facets.adjust_counts(values, -1)
+            return len(added), len(removed)
+
+        self.assertEqual(queries(1), queries(20))
+        self.assertFalse(models.Facet.objects.filter(value__startswith="bulk").exists())
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "Search uses SQLite FTS5")
+class SearchTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_memories(20)
+
+    def test_short_last_word_is_matched_whole(self):
+        self.assertEqual(search.build_match_query("my sc"), '"my" "sc"')
+        self.assertEqual(search.build_match_query("my sch"), '"my" "sch"*')
+        self.assertEqual(search.rank("sc"), [])
+        self.assertEqual(len(search.rank("sch")), 20)
+
+    def test_ranked_set_is_capped(self):
+        with mock.patch.object(search, "RANK_LIMIT", 5):
+            self.assertEqual(len(search.rank("school")), 5)
+            response = self.client.get("/?q=school")
+        self.assertEqual(response.context["memory_count"], 5)
+
+
+class BitmapIndexTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_memories(40)
+        cls.ids = list(
+            models.Memory.objects.order_by("id").values_list("id", flat=True)
+        )
+
+    def matching_ids(self, filters):
+        index = bitmaps.memory_index
+        return set(bitmaps.iter_ids(index.match(filters), 0, index.max_id + 1))
+
+    def expected_ids(self, **lookups):
+        return set(models.Memory.objects.filter(**lookups).values_list("id", flat=True))
+
+    def themed_ids(self, *themes):
+        ids = set(self.ids)
+        for theme in themes:
+            ids &= set(
+                models.MemoryTheme.objects.filter(theme__name=theme).values_list(
+                    "memory_id", flat=True
+                )
+            )
+        return ids
+
+    def test_values_of_a_facet_are_ored(self):
+        filters = {"gender": GENDERS[:2], "country": ["GB", "US"]}
+        self.assertEqual(
+            self.matching_ids(filters),
+            self.expected_ids(gender__in=GENDERS[:2], country__in=["GB", "US"]),
+        )
+        counts = bitmaps.memory_index.facet_counts(filters)
+        # An option counts what picking it too would match
+        for gender in GENDERS:
+            self.assertEqual(
+                counts[("gender", gender)],
+                len(self.expected_ids(gender=gender, country__in=["GB", "US"])),
+            )
+        self.assertEqual(
+            counts[("country", "GR")],
+            len(self.expected_ids(country="GR", gender__in=GENDERS[:2])),
+        )
+
+    def test_values_of_a_facet_are_anded_with_match_all(self):
+        filters = {"memory_theme": THEMES[:2], "match": "all"}
+        expected = self.themed_ids(*THEMES[:2])
+        self.assertTrue(expected)
+        self.assertEqual(self.matching_ids(filters), expected)
+        counts = bitmaps.memory_index.facet_counts(filters)
+        for theme in THEMES:
+            self.assertEqual(
+                counts[("memory_theme", theme)],
+                len(expected & self.themed_ids(theme)),
+            )
+        self.assertEqual(
+            self.matching_ids({"memory_theme": THEMES[:3], "match": "all"}), set()
+        )
+
+    def test_rare_options_are_kept_as_id_arrays(self):
+        index = bitmaps.memory_index
+        with self.captureOnCommitCallbacks(execute=True):
+            rare = models.Memory.objects.create(
+                location="Town",
+                country="GB",
+                heritage="Rare heritage",
+                school_grade="Year 1",
+                title="Rare",
+                body="Rare memory.",
+            )
+        option = ("heritage", "rare heritage")
+        self.assertNotIsInstance(index.bitmaps[option], int)
+        self.assertEqual(self.matching_ids({"heritage": ["rare heritage"]}), {rare.pk})
+        counts = index.facet_counts({"country": ["GB"]})
+        self.assertEqual(counts[option], 1)
+        self.assertEqual(index.facet_counts({"country": ["US"]})[option], 0)
+
+        index.remove(rare.pk, {(*option, "Rare heritage")})
+        self.assertNotIn(option, index.bitmaps)
+
+    def test_cursors_at_the_edges(self):
+        index = bitmaps.memory_index
+        everything = index.match({})
+        first, last = self.ids[0], self.ids[-1]
+        edges = [
+            # (after, before, ids, prev_cursor, next_cursor)
+            (None, None, self.ids[:10], None, self.ids[9]),
+            (first - 1, None, self.ids[:10], None, self.ids[9]),
+            (first, None, self.ids[1:11], self.ids[1], self.ids[10]),
+            (self.ids[-11], None, self.ids[-10:], self.ids[-10], None),
+            (last - 1, None, [last], last, None),
+            (last, None, [], None, None),
+            (last + 10**6, None, [], None, None),
+            (None, last + 10**6, self.ids[-10:], self.ids[-10], None),
+            (None, last + 1, self.ids[-10:], self.ids[-10], None),
+            (None, last, self.ids[-11:-1], self.ids[-11], self.ids[-2]),
+            (None, self.ids[10], self.ids[:10], None, self.ids[9]),
+            (None, self.ids[1], [first], None, first),
+            (None, first, [], None, None),
+        ]
+        for after, before, ids, prev_cursor, next_cursor in edges:
+            with self.subTest(after=after, before=before):
+                page = index.paginate(everything, 10, after=after, before=before)
+                self.assertEqual(page["ids"], ids)
+                self.assertEqual(page["prev_cursor"], prev_cursor)
+                self.assertEqual(page["next_cursor"], next_cursor)
+
+
+class ByteRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        ranges = [
+            ("bytes=0-9", (0, 9)),
+            ("bytes=10-10", (10, 10)),
+            ("bytes=90-1000", (90, 99)),
+            # Open-ended
+            ("bytes=95-", (95, 99)),
+            ("bytes=0-", (0, 99)),
+            # Suffix, the last N bytes
+            ("bytes=-10", (90, 99)),
+            ("bytes=-500", (0, 99)),
+        ]
+        for header, expected in ranges:
+            with self.subTest(header=header):
+                self.assertEqual(views.parse_byte_range(header, 100), expected)
+
+    def test_ignored_ranges(self):
+        # The whole file is sent for several ranges or a header not understood
+        for header in ("bytes=0-1,5-6", "bytes=-", "items=0-9", "bytes=a-b"):
+            with self.subTest(header=header):
+                self.assertIsNone(views.parse_byte_range(header, 100))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ("bytes=100-", "bytes=100-200", "bytes=5-2", "bytes=-0"):
+            with self.subTest(header=header), self.assertRaises(ValueError):
+                views.parse_byte_range(header, 100)
+
+
+class ImageRangeTests(CacheTestCase):
+    @classmethod
+    def setUpClass(cls):
+        directory = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(IMAGE_STORE_ROOT=directory))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = bytes(range(100))
+        cls.image = models.Image.objects.create(
+            name="bytes",
+            slug="bytes",
+            extension="png",
+            sha256=imagestore.save(cls.data),
+            size=len(cls.data),
+        )
+        cls.url = reverse("image_raw", args=(cls.image.slug, cls.image.extension))
+
+    def test_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.data[90:])
+        self.assertEqual(response["Content-Range"], "bytes 90-99/100")
+        self.assertIn('filename="bytes.png"', response["Content-Disposition"])
+
+    def test_stale_if_range_sends_everything(self):
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"other"'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+
+    def test_unsatisfiable_range_is_not_cached(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=200-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+        self.assertFalse(response.has_header("Cache-Control"))
+
+
+class ImageUploadTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user("uploader", password="password")
+
+    def setUp(self):
+        super().setUp()
+        # A store of each test's own, so that every test starts without files
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.store = directory / "images"
+        self.enterContext(
+            override_settings(
+                IMAGE_STORE_ROOT=self.store, IMAGE_VARIANT_ROOT=directory / "variants"
+            )
+        )
+        self.client.force_login(self.user)
+
+    def png(self, name, color="red"):
+        output = io.BytesIO()
+        Image.new("RGB", (8, 8), color).save(output, "PNG")
+        return SimpleUploadedFile(name, output.getvalue(), content_type="image/png")
+
+    def upload(self, *files):
+        return self.client.post(reverse("image_list"), {"file": list(files)})
+
+    def stored_files(self):
+        return sorted(path.name for path in self.store.rglob("*") if path.is_file())
+
+    def test_identical_uploads_are_stored_once(self):
+        response = self.upload(self.png("a.png"), self.png("b.png"))
+        self.assertRedirects(response, reverse("image_list"))
+        response = self.upload(self.png("c.png"), self.png("d.png", "blue"))
+        self.assertRedirects(response, reverse("image_list"))
+
+        images = models.Image.objects.order_by("id")
+        self.assertEqual([image.name for image in images], ["a", "d"])
+        # The originals, with a WebP rendition and stripped copy of each
+        self.assertEqual(
+            self.stored_files(),
+            sorted(
+                {
+                    sha256
+                    for image in images
+                    for sha256 in (
+                        image.sha256,
+                        image.webp_sha256,
+                        image.stripped_sha256,
+                    )
+                    if sha256
+                }
+            ),
+        )
+
+    def test_upload_past_the_limit_is_rejected(self):
+        data = b"\0" * (views.IMAGE_UPLOAD_LIMIT + 1)
+        response = self.upload(
+            SimpleUploadedFile("big.png", data, content_type="image/png")
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response.context["form"], "file", "File too big. Limit is 1MB."
+        )
+        self.assertFalse(models.Image.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+
+class IndexQueryTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_memories(120)
+
+    def test_queries_do_not_grow_with_filters(self):
+        # Values every page shares are cached on the first request, the pages
+        # below then each query for their memories alone
+        self.client.get("/?before=1")
+        filter_sets = [
+            {},
+            {"country": COUNTRIES},
+            {"country": COUNTRIES, "gender": GENDERS},
+            {"country": ["GB"], "gender": ["BOY"], "memory_theme": THEMES[:2]},
+            {"memory_theme": THEMES[:2], "match": "all"},
+            {
+                "heritage": [f"heritage {i}" for i in range(10)],
+                "school_grade": [f"year {i}" for i in range(1, 13)],
+            },
+            {
+                "school_funding": FUNDINGS[:3]
+                + [f"custom:trust {i}" for i in range(3)],
+                "memory_theme": THEMES,
+            },
+            {
+                "country": COUNTRIES,
+                "gender": GENDERS,
+                "heritage": [f"heritage {i}" for i in range(10)],
+                "school_grade": [f"year {i}" for i in range(1, 13)],
+                "school_funding": FUNDINGS[:3]
+                + [f"custom:trust {i}" for i in range(3)],
+                "memory_theme": THEMES,
+            },
+        ]
+        for filters in filter_sets:
+            url = "/?" + urlencode(filters, doseq=True)
+            with self.subTest(url=url), self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(response.context["memory_count"], 0)
+
+    def test_filter_form_selects_several_values(self):
+        response = self.client.get(
+            "/?" + urlencode({"gender": GENDERS[:2], "match": "all"}, doseq=True)
+        )
+        self.assertContains(
+            response, '<select name="gender" id="gender-filter" multiple'
+        )
+        for gender in GENDERS[:2]:
+            self.assertContains(response, f'<option value="{gender}" selected>')
+        self.assertContains(response, 'name="match" value="all" checked')
+
+
+class ConditionalGetTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_memories(10)
+        cls.memory = models.Memory.objects.order_by("id").first()
+        cls.page = models.Page.objects.create(slug="about", title="About", body="Hi")
+        models.SiteSettings(
+            introduction="Welcome", privacy_policy="Private", terms_of_service="Terms"
+        ).save()
+
+    def assert_not_modified(self, url, queries):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_index(self):
+        self.assert_not_modified("/", 0)
+        self.assert_not_modified("/?country=GB", 0)
+
+    def test_memory_detail(self):
+        # Only the memory's own change time is read
+        self.assert_not_modified(reverse("memory_detail", args=(self.memory.pk,)), 1)
+
+    def test_page_detail(self):
+        self.assert_not_modified(reverse("page_detail", args=(self.page.slug,)), 0)
+
+    def test_privacy_policy(self):
+        self.assert_not_modified(reverse("privacy_policy"), 0)
+
+    def test_terms_of_service(self):
+        self.assert_not_modified(reverse("terms_of_service"), 0)
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "Query plans are read on SQLite")
+class QueryPlanTests(CacheTestCase):
+    """Check that no query the views, handlers and admin issue filters by scanning a table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_memories(50)
+        cls.memory = models.Memory.objects.order_by("id").first()
+        cls.page = models.Page.objects.create(slug="about", title="About", body="Hi")
+        cls.image = models.Image.objects.create(
+            name="photo", slug="photo", extension="png", sha256="0" * 64
+        )
+        cls.superuser = models.User.objects.create_superuser(
+            "admin", "admin@example.com", "password"
+        )
+
+    def assert_indexed(self, queries):
+        statements = dict.fromkeys(
+            query["sql"] for query in queries if query["sql"].startswith("SELECT")
+        )
+        self.assertTrue(statements)
+        for sql in statements:
+            # Listing a whole table is a scan whatever the indexes
+            if " WHERE " not in sql:
+                continue
+            with self.subTest(sql=sql):
+                self.assertEqual(full_scans(sql), [])
+
+    def test_views(self):
+        # A session cookie keeps the index out of the page cache, so it queries
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = "query-plans"
+        urls = [
+            "/",
+            "/?q=school",
+            "/?"
+            + urlencode(
+                {
+                    "country": self.memory.country,
+                    "gender": self.memory.gender,
+                    "heritage": self.memory.heritage,
+                    "school_grade": self.memory.school_grade,
+                    "school_funding": self.memory.school_funding,
+                }
+            ),
+            reverse("memory_detail", args=(self.memory.pk,)),
+            reverse("page_detail", args=(self.page.slug,)),
+            reverse("privacy_policy"),
+            reverse("terms_of_service"),
+            reverse("image_raw", args=(self.image.slug, self.image.extension)),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            for url in urls:
+                self.client.get(url)
+        self.assert_indexed(queries)
+
+    def test_write_lookups(self):
+        """Run the lookups of the POST handlers and signals without writing."""
+        sha256 = "0" * 64
+        with CaptureQueriesContext(connection) as queries:
+            list(models.Image.objects.filter(sha256__in=[sha256]))
+            models.Image.objects.filter(
+                Q(sha256=sha256) | Q(webp_sha256=sha256) | Q(stripped_sha256=sha256)
+            ).exists()
+            models.Page.objects.filter(slug="query-plans").exists()
+            models.Memory.objects.filter(pk=0).first()
+            models.Memory.objects.filter(code="0000-0000").exists()
+            models.Memory.objects.filter(
+                school_funding="OTHER", school_funding_other_key="query plans"
+            ).exists()
+            list(models.User.objects.filter(is_superuser=True))
+        self.assert_indexed(queries)
+
+    def test_admin(self):
+        self.client.force_login(self.superuser)
+        urls = [
+            "/admin/main/memory/",
+            "/admin/main/image/",
+            "/admin/main/page/",
+            f"/admin/main/memory/?country__exact={self.memory.country}",
+            f"/admin/main/memory/?age__exact={self.memory.age}",
+            f"/admin/main/memory/?gender__exact={self.memory.gender}",
+            f"/admin/main/memory/?school_funding__exact={self.memory.school_funding}",
+            "/admin/main/memory/?"
+            + urlencode({"school_grade": self.memory.school_grade}),
+            f"/admin/main/memory/{self.memory.pk}/change/",
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200)
+        self.assert_indexed(queries)
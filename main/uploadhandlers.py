@@ -0,0 +1,32 @@
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Stop reading an upload once any of its files grows past a size limit.
+
+    Chunks are passed on unchanged to the handlers after this one, which keep
+    buffering the files as usual. Views check `exceeded` to tell a file cut
+    short from one that was never sent.
+    """
+
+    def __init__(self, request=None, limit=None):
+        super().__init__(request)
+        self.limit = limit
+        self.exceeded = False
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            self.exceeded = True
+            # The rest of the body is read and discarded, so that the client
+            # gets the error response rather than a reset connection
+            raise StopUpload(connection_reset=False)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -1,20 +1,33 @@
+import os
+import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import httpx
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LogoutView as DjLogoutView
 from django.core.mail import send_mail
-from django.db.models import Q
+from django.db import transaction
 from django.http import (
+    FileResponse,
     Http404,
     HttpResponse,
     HttpResponseBadRequest,
 )
 from django.shortcuts import render
 from django.urls import reverse, reverse_lazy
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.generic import (
     CreateView,
     DeleteView,
@@ -24,170 +37,208 @@ from django.views.generic import (
     UpdateView,
 )
 
-from main import forms, models
+from main import (
+    bitmaps,
+    caching,
+    facets,
+    forms,
+    imagestore,
+    models,
+    pagecache,
+    search,
+    uploadhandlers,
+)
+from main.conditional import generations_version, versioned
+
+MEMORY_PAGE_SIZE = 100
+
+# Image file limit 1.1MB = 1.1 * 1000^2
+IMAGE_UPLOAD_LIMIT = 1_100_000
+
+# Threads processing the files of one image upload
+UPLOAD_WORKERS = 4
+
+# Image URLs never change contents, so browsers and proxies may keep them a year
+IMAGE_MAX_AGE = 60 * 60 * 24 * 365
+# Responses to image requests that are safe to keep that long
+CACHEABLE_IMAGE_STATUSES = {200, 206, 304}
 
 
 def extract_filters_from_request(request):
-    """Extract all filter parameters from the request."""
-    return {
-        "country": request.GET.get("country", ""),
-        "gender": request.GET.get("gender", ""),
-        "heritage": request.GET.get("heritage", ""),
-        "school_grade": request.GET.get("school_grade", ""),
-        "school_funding": request.GET.get("school_funding", ""),
-        "memory_theme": request.GET.get("memory_theme", ""),
+    """Extract all filter parameters from the request.
+
+    Each facet can be given several times; its values are ORed, or ANDed with
+    match=all. Free text is matched by grouping key, whatever its case or spacing.
+    """
+    filters = {
+        facet: sorted(
+            {
+                facets.filter_value(facet, value)
+                for value in request.GET.getlist(facet)
+                if value
+            }
+            - {""}
+        )
+        for facet in bitmaps.FACETS
     }
+    filters["match"] = "all" if request.GET.get("match") == "all" else ""
+    filters["q"] = request.GET.get("q", "").strip()
+    return filters
 
 
-def get_non_empty_field_values(model_or_queryset, field_name):
-    """Get unique non-empty values for a given field, excluding null, empty, and whitespace-only values."""
-    # Handle both model classes and querysets
-    if hasattr(model_or_queryset, "objects"):
-        # It's a model class
-        queryset = model_or_queryset.objects
-    else:
-        # It's already a queryset
-        queryset = model_or_queryset
-
-    return (
-        queryset.exclude(**{f"{field_name}__isnull": True})
-        .exclude(**{f"{field_name}__exact": ""})
-        .exclude(**{f"{field_name}__regex": r"^\s*$"})
-        .values_list(field_name, flat=True)
-        .distinct()
-        .order_by(field_name)
+def get_cursor(request, name):
+    """Get a pagination cursor (a memory id or page number) from the request, if valid."""
+    try:
+        value = int(request.GET.get(name, ""))
+    except ValueError:
+        return None
+    return value if value >= 0 else None
+
+
+def paginate_memories(matching, after=None, before=None):
+    """Return one page of the matching memories ordered by id, with cursors for the neighbouring pages.
+
+    Only the fields the memory grid shows are selected, so the page query never
+    reads the memory body.
+    """
+    page = bitmaps.memory_index.paginate(
+        matching, MEMORY_PAGE_SIZE, after=after, before=before
+    )
+    page["memory_list"] = list(
+        models.Memory.objects.filter(id__in=page.pop("ids"))
+        .values("id", "title")
+        .order_by("id")
     )
+    return page
 
 
-def apply_memory_filters(queryset, filters):
-    """Apply all filters to the memory queryset."""
-    if filters["country"]:
-        queryset = queryset.filter(country=filters["country"])
-    if filters["gender"]:
-        queryset = queryset.filter(gender=filters["gender"])
-    if filters["heritage"]:
-        queryset = queryset.filter(heritage=filters["heritage"])
-    if filters["school_grade"]:
-        queryset = queryset.filter(school_grade=filters["school_grade"])
-    if filters["school_funding"]:
-        queryset = apply_school_funding_filter(queryset, filters["school_funding"])
-    if filters["memory_theme"]:
-        queryset = apply_memory_theme_filter(queryset, filters["memory_theme"])
-    return queryset
-
-
-def apply_school_funding_filter(queryset, school_funding_filter):
-    """Apply school funding filter handling both predefined choices and custom 'other' entries."""
-    if school_funding_filter == "OTHER":
-        return queryset.filter(school_funding="OTHER")
-
-    # Check if it's a custom school funding (from school_funding_other field)
-    custom_school_fundings = models.Memory.objects.filter(
-        school_funding="OTHER", school_funding_other=school_funding_filter
-    ).values_list("id", flat=True)
-
-    if custom_school_fundings.exists():
-        return queryset.filter(
-            school_funding="OTHER", school_funding_other=school_funding_filter
-        )
-    else:
-        return queryset.filter(school_funding=school_funding_filter)
+def order_by_choices(options, choices):
+    """Order options as in choices, keeping options missing from choices last."""
+    order = {code: position for position, (code, _) in enumerate(choices)}
+    return sorted(options, key=lambda option: order.get(option[0], len(order)))
 
 
-def apply_memory_theme_filter(queryset, memory_theme_filter):
-    """Apply memory theme filter searching in both theme fields."""
-    return queryset.filter(
-        Q(memory_themes__icontains=memory_theme_filter)
-        | Q(memory_themes_additional__icontains=memory_theme_filter)
+def load_facet_labels():
+    return list(
+        models.Facet.objects.values_list("facet", "value", "label").order_by(
+            "facet", "value"
+        )
     )
 
 
-def build_filter_options():
-    """Build all filter options for the template."""
-    # Countries - exclude countries with no memories
-    used_countries = models.Memory.objects.values_list("country", flat=True).distinct()
-    countries = [
-        (code, name)
-        for code, name in models.Memory.COUNTRY_CHOICES
-        if code in used_countries
-    ]
-
-    # School funding - predefined choices + custom ones
-    school_fundings = []
-    # Add predefined choices that have memories
-    used_predefined_fundings = (
-        models.Memory.objects.exclude(school_funding="OTHER")
-        .values_list("school_funding", flat=True)
-        .distinct()
-    )
-    for code, name in models.Memory.SCHOOL_FUNDING_CHOICES:
-        if code in used_predefined_fundings:
-            school_fundings.append((code, name))
-    # Add custom school fundings from school_funding_other field
-    custom_school_fundings = get_non_empty_field_values(
-        models.Memory.objects.filter(school_funding="OTHER"), "school_funding_other"
-    )
-    for custom_funding in custom_school_fundings:
-        school_fundings.append((custom_funding, custom_funding))
-
-    # Memory themes - extract from both fields
-    all_themes = set()
-    # Get themes from memory_themes field
-    memory_themes_data = get_non_empty_field_values(models.Memory, "memory_themes")
-    for themes_string in memory_themes_data:
-        if themes_string:
-            themes_list = [
-                theme.strip() for theme in themes_string.split(",") if theme.strip()
-            ]
-            all_themes.update(themes_list)
-    # Get themes from memory_themes_additional field
-    additional_themes_data = get_non_empty_field_values(
-        models.Memory, "memory_themes_additional"
+def selected_labels(options, selected):
+    """Get the labels of the selected values of a facet, for the results summary."""
+    labels = {value: label for value, label, _ in options}
+    return [labels.get(value, value) for value in selected]
+
+
+def build_filter_options(counts, filters):
+    """Build all filter options for the template from the materialized facets.
+
+    Each option is a (value, label, count) tuple, where count is the number of
+    memories it would show given the other active filters. Options that would
+    show none are left out, unless selected.
+    """
+    options = {facet: [] for facet in bitmaps.FACETS}
+    facet_labels = caching.get_or_compute(
+        ("filter_options",), load_facet_labels, ("memories",)
     )
-    for themes_string in additional_themes_data:
-        if themes_string:
-            themes_list = [
-                theme.strip() for theme in themes_string.split(",") if theme.strip()
-            ]
-            all_themes.update(themes_list)
-    memory_themes = [(theme, theme) for theme in sorted(all_themes)]
+    for facet, value, label in facet_labels:
+        count = counts.get((facet, value), 0)
+        if count or value in filters[facet]:
+            options[facet].append((value, label, count))
 
     return {
-        "countries": countries,
-        "genders": models.Memory.GENDER_CHOICES,
-        "heritages": [
-            (heritage, heritage)
-            for heritage in get_non_empty_field_values(models.Memory, "heritage")
-        ],
-        "school_grades": [
-            (grade, grade)
-            for grade in get_non_empty_field_values(models.Memory, "school_grade")
-        ],
-        "school_fundings": school_fundings,
-        "memory_themes": memory_themes,
+        "countries": order_by_choices(
+            options["country"], models.Memory.COUNTRY_CHOICES
+        ),
+        "genders": order_by_choices(options["gender"], models.Memory.GENDER_CHOICES),
+        "heritages": options["heritage"],
+        "school_grades": options["school_grade"],
+        # Predefined choices first, then custom ones
+        "school_fundings": order_by_choices(
+            options["school_funding"], models.Memory.SCHOOL_FUNDING_CHOICES
+        ),
+        "memory_themes": options["memory_theme"],
     }
 
 
+def index_version(request):
+    return generations_version(
+        "memories", "pages", "site_settings", extra=request.GET.urlencode()
+    )
+
+
+@versioned(index_version)
 def index(request):
     filters = extract_filters_from_request(request)
-    memories = apply_memory_filters(models.Memory.objects.all(), filters)
-    filter_options = build_filter_options()
+    if not pagecache.is_cacheable(request):
+        return render_index(request, filters)
+
+    cursors = {name: get_cursor(request, name) for name in ("after", "before", "page")}
+    content = pagecache.get_or_render(
+        filters | cursors, lambda: render_index(request, filters).content
+    )
+    response = HttpResponse(content)
+    patch_vary_headers(response, ("Cookie",))
+    return response
+
+
+def render_index(request, filters):
+    bitmaps.memory_index.ensure_current()
+    within = None
+    if filters["q"]:
+        ranked_ids = search.rank(filters["q"])
+        within = bitmaps.bitmap_from_ids(ranked_ids, max(ranked_ids, default=0))
+    matching = bitmaps.memory_index.match(filters, within)
+    if filters["q"]:
+        # Search results are ranked by relevance, so they are paged by number
+        is_matching = bitmaps.membership(matching)
+        page = search.paginate_memories(
+            filters["q"],
+            [memory_id for memory_id in ranked_ids if is_matching(memory_id)],
+            get_cursor(request, "page"),
+        )
+    else:
+        page = paginate_memories(
+            matching,
+            after=get_cursor(request, "after"),
+            before=get_cursor(request, "before"),
+        )
+    filter_options = build_filter_options(
+        bitmaps.memory_index.facet_counts(filters, within), filters
+    )
     context = {
-        "page_list": models.Page.objects.all().defer("body"),
-        "memory_list": memories,
-        "site_settings": models.SiteSettings.objects.first(),
+        "memory_count": matching.bit_count(),
+        "memory_list": page["memory_list"],
+        "prev_cursor": page.get("prev_cursor"),
+        "next_cursor": page.get("next_cursor"),
+        "prev_page": page.get("prev_page"),
+        "next_page": page.get("next_page"),
+        "site_settings": models.SiteSettings.load(),
         "countries": filter_options["countries"],
         "selected_country": filters["country"],
         "genders": filter_options["genders"],
         "selected_gender": filters["gender"],
         "heritages": filter_options["heritages"],
         "selected_heritage": filters["heritage"],
+        "selected_heritage_labels": selected_labels(
+            filter_options["heritages"], filters["heritage"]
+        ),
         "school_grades": filter_options["school_grades"],
         "selected_school_grade": filters["school_grade"],
+        "selected_school_grade_labels": selected_labels(
+            filter_options["school_grades"], filters["school_grade"]
+        ),
         "school_fundings": filter_options["school_fundings"],
         "selected_school_funding": filters["school_funding"],
+        "selected_school_funding_labels": selected_labels(
+            filter_options["school_fundings"], filters["school_funding"]
+        ),
         "memory_themes": filter_options["memory_themes"],
         "selected_memory_theme": filters["memory_theme"],
+        "match_all": filters["match"] == "all",
+        "search_query": filters["q"],
         "filters_active": any(filters.values()),
     }
     return render(request, "main/memory_list.html", context)
@@ -210,11 +261,7 @@ class UserUpdate(LoginRequiredMixin, UpdateView):
 
 @login_required
 def dashboard(request):
-    return render(
-        request,
-        "main/dashboard.html",
-        {"page_list": models.Page.objects.all()},
-    )
+    return render(request, "main/dashboard.html")
 
 
 # Static Pages
@@ -239,12 +286,15 @@ class PrivacyPolicyUpdate(LoginRequiredMixin, UpdateView):
     def get_object(self):
         return models.SiteSettings.load()
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["page_list"] = models.Page.objects.all()
-        return context
-
 
+@method_decorator(
+    versioned(
+        lambda request: generations_version(
+            "site_settings", "pages", extra="privacy_policy"
+        )
+    ),
+    name="dispatch",
+)
 class PrivacyPolicy(TemplateView):
     template_name = "main/privacy_policy.html"
 
@@ -263,12 +313,15 @@ class TermsOfServiceUpdate(LoginRequiredMixin, UpdateView):
     def get_object(self):
         return models.SiteSettings.load()
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["page_list"] = models.Page.objects.all()
-        return context
-
 
+@method_decorator(
+    versioned(
+        lambda request: generations_version(
+            "site_settings", "pages", extra="terms_of_service"
+        )
+    ),
+    name="dispatch",
+)
 class TermsOfService(TemplateView):
     template_name = "main/terms_of_service.html"
 
@@ -290,17 +343,16 @@ class PageCreate(LoginRequiredMixin, CreateView):
         return reverse("page_detail", args=(self.object.slug,))
 
 
+@method_decorator(
+    versioned(lambda request, slug: generations_version("pages", extra=slug)),
+    name="dispatch",
+)
 class PageDetail(DetailView):
     model = models.Page
 
     def get_success_url(self):
         return reverse("page_detail", args=(self.object.slug,))
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["page_list"] = models.Page.objects.all()
-        return context
-
 
 class PageUpdate(LoginRequiredMixin, UpdateView):
     model = models.Page
@@ -329,41 +381,83 @@ class PageDelete(LoginRequiredMixin, DeleteView):
 # Images
 
 
+# The CSRF check reads the upload, so it runs in post once the limit is in place
+@method_decorator(csrf_exempt, name="dispatch")
 class ImageList(LoginRequiredMixin, FormView):
     form_class = forms.UploadImagesForm
     template_name = "main/image_list.html"
     success_url = reverse_lazy("image_list")
 
+    def dispatch(self, request, *args, **kwargs):
+        self.upload_limit = uploadhandlers.LimitedUploadHandler(
+            request, IMAGE_UPLOAD_LIMIT
+        )
+        request.upload_handlers.insert(0, self.upload_limit)
+        return super().dispatch(request, *args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["image_list"] = models.Image.objects.all()
         return context
 
+    @method_decorator(csrf_protect)
     def post(self, request, *args, **kwargs):
         form_class = self.get_form_class()
         form = self.get_form(form_class)
         files = request.FILES.getlist("file")
+        if self.upload_limit.exceeded:
+            form.add_error("file", "File too big. Limit is 1MB.")
+            return self.form_invalid(form)
         if form.is_valid():
+            uploads = []
             for f in files:
                 name_ext_parts = f.name.rsplit(".", 1)
                 name = name_ext_parts[0].replace(".", "-")
-                self.extension = name_ext_parts[1].casefold()
-                if self.extension == "jpg":
-                    self.extension = "jpeg"
-                data = f.read()
+                extension = name_ext_parts[1].casefold()
+                if extension == "jpg":
+                    extension = "jpeg"
 
-                # Image file limit 1.1MB = 1.1 * 1000^2
-                if len(data) > 1.1 * 1000 * 1000:
+                stored = imagestore.save_chunks(f.chunks(), IMAGE_UPLOAD_LIMIT)
+                if stored is None:
                     form.add_error("file", "File too big. Limit is 1MB.")
                     return self.form_invalid(form)
+                uploads.append((name, extension, *stored))
 
-                self.slug = str(uuid.uuid4())[:8]
-                models.Image.objects.create(
-                    name=name,
-                    data=data,
-                    extension=self.extension,
-                    slug=self.slug,
+            # Files already uploaded are reused as they are
+            images = {
+                image.sha256: image
+                for image in models.Image.objects.filter(
+                    sha256__in=[sha256 for _, _, sha256, _ in uploads]
+                )
+            }
+            new_hashes = list(
+                dict.fromkeys(
+                    sha256 for _, _, sha256, _ in uploads if sha256 not in images
+                )
+            )
+            # Decoding and encoding release the GIL, so files are processed in parallel
+            with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+                renditions = dict(
+                    zip(
+                        new_hashes,
+                        executor.map(imagestore.make_renditions, new_hashes),
+                        strict=True,
+                    )
                 )
+
+            with transaction.atomic():
+                for name, extension, sha256, size in uploads:
+                    if sha256 not in images:
+                        images[sha256] = models.Image.objects.create(
+                            name=name,
+                            extension=extension,
+                            slug=str(uuid.uuid4())[:8],
+                            sha256=sha256,
+                            size=size,
+                            **renditions[sha256],
+                        )
+                    self.slug = images[sha256].slug
+                    self.extension = images[sha256].extension
             return self.form_valid(form)
         else:
             return self.form_invalid(form)
@@ -381,7 +475,8 @@ class ImageList(LoginRequiredMixin, FormView):
     def form_invalid(self, form):
         # if ?raw=true in url, return form error as string
         if (
-            len(self.request.FILES.getlist("file")) == 1
+            # A file cut short at the upload limit is missing from FILES
+            len(self.request.FILES.getlist("file")) <= 1
             and self.request.GET.get("raw") == "true"
         ):
             return HttpResponseBadRequest(" ".join(form.errors["file"]))
@@ -393,11 +488,117 @@ class ImageDetail(LoginRequiredMixin, DetailView):
     model = models.Image
 
 
+def parse_byte_range(header, size):
+    """Parse a single-range Range header into an inclusive (start, end) pair.
+
+    Returns None when the header should be ignored and the whole file sent,
+    which includes multiple ranges, and raises ValueError if it cannot be satisfied.
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
 async def image_raw(request, slug, extension):
-    image = await models.Image.objects.filter(slug=slug).afirst()
-    if not image or extension != image.extension:
+    image = (
+        await models.Image.objects.filter(slug=slug)
+        .values("sha256", "extension", "webp_sha256", "stripped_sha256")
+        .afirst()
+    )
+    if not image or extension != image["extension"]:
+        raise Http404()
+    width = get_cursor(request, "w")
+    if width is not None and width not in imagestore.VARIANT_WIDTHS:
         raise Http404()
-    return HttpResponse(image.data, content_type="image/" + image.extension)
+
+    # Only images that could be decoded have a WebP rendition, or can be resized,
+    # or a copy of the original stripped of metadata such as the EXIF location
+    original = image["stripped_sha256"] or image["sha256"]
+    accepts_webp = "image/webp" in request.headers.get("Accept", "")
+    variant_format = None
+    if width and image["webp_sha256"]:
+        if accepts_webp:
+            variant_format = "WEBP"
+        else:
+            variant_format = "JPEG" if extension == "jpeg" else "PNG"
+        sha256, content_type = image["sha256"], "image/" + variant_format.lower()
+        etag = f'"{sha256}-{width}.{variant_format.lower()}"'
+    elif image["webp_sha256"] and accepts_webp:
+        sha256, content_type = image["webp_sha256"], "image/webp"
+        etag = f'"{sha256}"'
+    else:
+        sha256, content_type = original, "image/" + extension
+        etag = f'"{sha256}"'
+
+    # A slug always points at the same contents, so the hash is a strong ETag
+    # and the response can be cached forever
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        f = None
+        if variant_format:
+            f = await sync_to_async(imagestore.open_variant, thread_sensitive=False)(
+                sha256, width, variant_format
+            )
+            if f is None:
+                sha256, content_type = original, "image/" + extension
+        if f is None:
+            try:
+                # Closed by FileResponse once sent
+                f = open(imagestore.path(sha256), "rb")  # noqa: SIM115
+            except FileNotFoundError:
+                raise Http404() from None
+        # Named after the slug rather than the stored file, with the extension
+        # of the format served
+        filename = f"{slug}.{content_type.removeprefix('image/')}"
+        response = serve_image_file(request, f, content_type, etag, filename)
+    response.headers["ETag"] = etag
+    response.headers["Accept-Ranges"] = "bytes"
+    # Errors such as an unsatisfiable range must not be cached
+    if response.status_code in CACHEABLE_IMAGE_STATUSES:
+        patch_cache_control(
+            response, public=True, max_age=IMAGE_MAX_AGE, immutable=True
+        )
+    if image["webp_sha256"]:
+        patch_vary_headers(response, ("Accept",))
+    return response
+
+
+def serve_image_file(request, f, content_type, etag, filename):
+    size = os.fstat(f.fileno()).st_size
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            f.close()
+            response = HttpResponse(status=416)
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+        if byte_range:
+            start, end = byte_range
+            with f:
+                f.seek(start)
+                response = HttpResponse(
+                    f.read(end - start + 1), content_type=content_type, status=206
+                )
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response.headers["Content-Disposition"] = content_disposition_header(
+                False, filename
+            )
+            return response
+    # Served with sendfile where the server supports it, without reading into memory
+    return FileResponse(f, content_type=content_type, filename=filename)
 
 
 class ImageUpdate(LoginRequiredMixin, UpdateView):
@@ -456,7 +657,6 @@ class Contact(FormView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["page_list"] = models.Page.objects.all()
         context["enable_turnstile"] = bool(settings.TURNSTILE_SECRET)
         return context
 
@@ -520,17 +720,22 @@ class MemoryCreate(FormView):
             )
             return self.form_invalid(form)
 
-        obj = form.save()
+        with transaction.atomic():
+            obj = form.save()
+            if settings.LOCALDEV or (
+                settings.EMAIL_HOST_USER and settings.EMAIL_HOST_PASSWORD
+            ):
+                # Sent once the memory is stored; a mail failure is logged
+                # rather than failing a submission that went through
+                transaction.on_commit(
+                    lambda: self.send_notification_email(obj), robust=True
+                )
         message = (
             "Thank you for your submission. Here’s your memory code number "
             f"#{obj.code}. Please, save this number in case you wish to reach out about"
             " something concerning your memory in the future."
         )
         messages.success(self.request, message)
-        if settings.LOCALDEV or (
-            settings.EMAIL_HOST_USER and settings.EMAIL_HOST_PASSWORD
-        ):
-            self.send_notification_email(obj)
         return self.form_valid(form)
 
     def send_notification_email(self, memory):
@@ -580,16 +785,23 @@ class MemoryCreate(FormView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["page_list"] = models.Page.objects.all()
         context["enable_turnstile"] = bool(settings.TURNSTILE_SECRET)
         return context
 
 
+def memory_version(request, pk):
+    updated_at = (
+        models.Memory.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+    )
+    if updated_at is None:
+        return None
+    tag, pages_changed_at = generations_version(
+        "pages", extra=f"{pk}:{updated_at.isoformat()}"
+    )
+    return tag, max(updated_at, pages_changed_at)
+
+
+@method_decorator(versioned(memory_version), name="dispatch")
 class MemoryDetail(DetailView):
     model = models.Memory
     template_name = "main/memory_detail.html"
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["page_list"] = models.Page.objects.all()
-        return context
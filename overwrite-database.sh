@@ -1,5 +1,5 @@
 #!/usr/bin/env bash
-# Overwrites local sqlite database with production one.
+# Overwrites local sqlite database and uploaded images with production ones.
 
 
 set -o errexit
@@ -7,3 +7,4 @@ set -o nounset
 set -o pipefail
 
 scp root@schoolmemories.01z.io:/var/www/schoolmemories/db.sqlite3 .
+rsync -a root@schoolmemories.01z.io:/var/www/schoolmemories/media/ media/
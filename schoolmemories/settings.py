@@ -85,6 +85,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "main.context_processors.page_list",
             ],
         },
     },
@@ -107,6 +108,25 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock when a transaction starts, so that workers
+            # writing at the same time wait for each other instead of failing
+            # with "database is locked" when a read turns into a write
+            "transaction_mode": "IMMEDIATE",
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# File based, so that all gunicorn workers share it without a cache service
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
     }
 }
 
@@ -148,6 +168,13 @@ USE_TZ = True
 STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "static"
 
+# Uploaded images, stored by the SHA-256 of their contents
+IMAGE_STORE_ROOT = BASE_DIR / "media" / "images"
+
+# Resized image variants, made on request and evicted least recently used first
+IMAGE_VARIANT_ROOT = BASE_DIR / "media" / "variants"
+IMAGE_VARIANT_CACHE_SIZE = 500 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 